@@ -107,14 +107,21 @@ def create_directories(dir_conf, prefix=None):
         create_directories(subfolders, prefix)
 
 
-def file_checksum(filename):
-    """Return the sha256 digest of a file.
+def file_checksum(filename, chunk_size=1048576):
+    """Return the sha256 digest of a file. The file is read by chunks to keep memory usage low.
 
     Parameters:
         filename (str): The file to hash.
+        chunk_size (int): Number of bytes read at once. Default to 1MB.
 
     Returns:
         str: Hash of the file.
     """
-    return sha256(open(filename).read()).hexdigest()
+    file_hash = sha256()
+
+    with open(filename, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(chunk_size), ""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
 
@@ -31,6 +31,9 @@ class Denoiser(object):
         self.indicator_model = IndicatorModel(self.config)
         self.learning_model = MachineLearningModel(self.config)
 
+        # The inline model keeps the unigrams up to date while cleaning texts
+        self.learning_model.unigrams = self.inline_model.unigrams
+
         self.logger.info("Denoiser initialized")
 
     def cleanse(self, filename, is_csv=False):
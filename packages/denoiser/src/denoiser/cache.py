@@ -0,0 +1,99 @@
+"""Process-wide cache of the denoiser, to avoid loading its models for every text to clean
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import logging
+from os import stat
+from os.path import join
+from threading import Lock
+from time import time
+from denoiser import Denoiser
+
+
+def get_version_filename(app_config):
+    """Get the path of the version stamp of the models
+
+    Parameters:
+        app_config (dict): Application configuration
+
+    Returns:
+        str: Path of the stamp
+    """
+    return join(app_config["root"], app_config["dirs"]["models_root"], app_config["models"]["version"])
+
+
+def get_model_version(app_config):
+    """Get the version of the models, which changes when they are generated or imported
+
+    Parameters:
+        app_config (dict): Application configuration
+
+    Returns:
+        float: Modification time of the version stamp, None if there is none
+    """
+    try:
+        return stat(get_version_filename(app_config)).st_mtime
+    except OSError:
+        return None
+
+
+def update_model_version(app_config):
+    """Change the version of the models, once they have been generated or imported
+
+    Parameters:
+        app_config (dict): Application configuration
+    """
+    with open(get_version_filename(app_config), "w") as version_file:
+        version_file.write("%f\n" % time())
+
+
+class DenoiserCache(object):
+    """Keeps a single denoiser per process and reloads it only when a new version of the models is available
+
+    Cleansing a text updates the inline models, in memory and on disk. These updates do not change the version of the
+    models: the process keeps the models it has loaded, shared with the other processes of the slave pool until they
+    write to them, instead of loading them again after every text cleansed by another process.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('local')
+        self.lock = Lock()
+
+        self.denoiser = None
+        self.version = None
+
+    def get(self, app_config):
+        """Get the denoiser, loading it if the version of the models has changed since the last call
+
+        Parameters:
+            app_config (dict): Application configuration
+
+        Returns:
+            `Denoiser`: Denoiser ready to cleanse a file
+        """
+        with self.lock:
+            version = get_model_version(app_config)
+
+            if self.denoiser is None or version != self.version:
+                self.logger.info("Loading denoiser models...")
+
+                self.denoiser = Denoiser(app_config)
+                self.version = version
+
+            return self.denoiser
+
+
+denoiser_cache = DenoiserCache()
+"""DenoiserCache: Denoiser shared by the whole process.
+"""
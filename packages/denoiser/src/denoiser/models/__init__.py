@@ -294,6 +294,10 @@ class MachineLearningModel(AbstractModel):
             "features": MachineLearningFeatures()
         }
 
+        # Loaded on the first correction
+        self.unigrams = None
+        self.classifier_loaded = False
+
     def train(self, dataset):
         """Train the model with a dataset
 
@@ -352,19 +356,22 @@ class MachineLearningModel(AbstractModel):
         Args:
             text_data (`Text`): Text data
         """
-        unigrams = Unigrams(join(self.config["root"],
-                                 self.config["dirs"]["models_root"],
-                                 self.config["dirs"]["models"]["inline"],
-                                 self.config["models"]["inline"]["unigrams"],))
+        if self.unigrams is None:
+            self.unigrams = Unigrams(join(self.config["root"],
+                                          self.config["dirs"]["models_root"],
+                                          self.config["dirs"]["models"]["inline"],
+                                          self.config["models"]["inline"]["unigrams"],))
 
-        ml_classifier = load(join(self.config["dirs"]["models_root"],
-                                  self.config["dirs"]["models"]["learning"],
-                                  self.config["models"]["learning"]["classifier"]))
+        if not self.classifier_loaded:
+            ml_classifier = load(join(self.config["dirs"]["models_root"],
+                                      self.config["dirs"]["models"]["learning"],
+                                      self.config["models"]["learning"]["classifier"]))
 
-        if ml_classifier is None:
-            return
+            if ml_classifier is None:
+                return
 
-        self.model["algo"].set_classifier(ml_classifier)
+            self.model["algo"].set_classifier(ml_classifier)
+            self.classifier_loaded = True
 
         for paragraph in text_data.text:
             for line in paragraph:
@@ -372,5 +379,5 @@ class MachineLearningModel(AbstractModel):
                     continue
 
                 f = MachineLearningFeatures()
-                features = f.extract_features(line, unigrams.ngrams, text_data.stats)
+                features = f.extract_features(line, self.unigrams.ngrams, text_data.stats)
                 line.grade = self.model["algo"].classify(features) * 5
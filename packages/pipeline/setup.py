@@ -19,8 +19,13 @@ setup(
         'denoiser',
         'fabric',
         'matplotlib',
+        'numpy',
         'redis',
         'hiredis',
         'PyPDF2',
     ],
+
+    extras_require={
+        'inotify': ['pyinotify'],
+    },
 )
@@ -1,4 +1,4 @@
-"""Let you start a slave or master process
+"""Let you start a slave or master process, or the OCR server of a machine
 
 .. Authors:
     Philippe Dessauw
@@ -16,6 +16,8 @@
 import signal
 import sys
 from actors import Slave, Master
+from ocrserver import OcrServer
+from pool import SlavePool
 
 orig_sigint = signal.getsignal(signal.SIGINT)
 """object: Original INTERUPT signal
@@ -49,6 +51,29 @@ def run_slave(app_config):
     s.run()
 
 
+def run_slave_pool(app_config, workers=0):
+    """Start a pool of slave processes
+
+    Parameter:
+        app_config (dict): Application configuration
+        workers (int): Number of slaves to start (0 to start one per core)
+    """
+    pool = SlavePool(app_config, workers)
+
+    def terminate(signum, frame):
+        """Drain the slaves, or kill them if the signal is received twice
+
+        Parameters
+            signum (int): Signal code
+            frame (object): original signal
+        """
+        pool.stop()
+
+    signal.signal(signal.SIGINT, terminate)
+    signal.signal(signal.SIGTERM, terminate)
+    pool.run()
+
+
 def run_master(app_config):
     """Start the master process
 
@@ -68,9 +93,42 @@ def run_master(app_config):
 
         try:
             m.stop()
+
+            # Queues served by the master are only stopped once it has stopped using them
+            if m.queue_server is not None:
+                m.queue_server.shutdown()
+
             sys.exit(0)
         except:
             sys.exit(1)
 
     signal.signal(signal.SIGINT, terminate)
     m.run()
+
+
+def run_ocr_server(app_config):
+    """Start the OCR server of the machine
+
+    Parameter:
+        app_config (dict): Application configuration
+    """
+    server = OcrServer(app_config)
+
+    def terminate(signum, frame):
+        """Stop the process in a clean way
+
+        Parameters
+            signum (int): Signal code
+            frame (object): original signal
+        """
+        signal.signal(signal.SIGINT, orig_sigint)
+
+        try:
+            server.stop()
+            sys.exit(0)
+        except:
+            sys.exit(1)
+
+    signal.signal(signal.SIGINT, terminate)
+    signal.signal(signal.SIGTERM, terminate)
+    server.run()
@@ -13,17 +13,25 @@
     National Institute of Standards and Technology
     http://www.nist.gov/itl/ssd/is
 """
+import json
 import logging
-from os import listdir, getpid, remove
-from os.path import join, exists, split
+import traceback
+from os import getpid
+from os.path import exists, split, isfile
 from socket import gethostbyname, gethostname
 from time import sleep
-from shutil import move
 from pipeline.files import FileManager
 from pipeline.threads import StoppableThread
-from pipeline.utils import create_data_directory
+from pipeline.watcher import InputWatcher
+from pipeline.ingest import IngestionPool
+from pipeline.utils import create_data_directory, move_directory
+from pipeline.dedup import DedupIndex, link_outputs
+from apputils.fileop import file_checksum
 from pipeline.logger import AppLogger, LogWriter
-from pipeline.queue import QueueManager, CommandQueueItem
+from pipeline.locks import get_host_semaphore
+from pipeline.backends import use_backend
+from pipeline.queue import QueueManager, CommandQueueItem, LeaseRenewer, LeaseReaper, QueueConsumer, \
+    get_stage_queues, create_jobs, leased_pop_any
 
 
 class Master(StoppableThread):
@@ -38,13 +46,31 @@ class Master(StoppableThread):
         redis_ip = app_config["redis"]["host"]
         redis_port = app_config["redis"]["port"]
 
-        self.logger = AppLogger("master", logging.getLogger("local"), redis_ip, redis_port)
+        # Started here if the queues are kept by the master
+        self.queue_server = use_backend(app_config, serve=True)
+
+        self.logger = AppLogger("master", logging.getLogger("local"), redis_ip, redis_port,
+                                logging.getLevelName(app_config["log"]["level"]), app_config["log"]["batch"],
+                                app_config["log"]["flush"])
         self.log_writer = LogWriter(logging.getLogger("app"), redis_ip, redis_port)
 
-        self.command_queue = QueueManager(host=redis_ip, port=redis_port, qname="commands")
+        self.stage_queues = get_stage_queues(app_config, redis_ip, redis_port)
         self.finished_queue = QueueManager(host=redis_ip, port=redis_port, qname="finished")
         # self.fman = FileManager(master_ip, master_queue_port)
         self.fman = FileManager(app_config)
+        self.dedup = DedupIndex(host=redis_ip, port=redis_port) if app_config["ingest"]["dedup"] else None
+
+        # Backpressure is computed on the first stage, where new jobs are pushed
+        self.ingestion_pool = IngestionPool(self.ingest, self.stage_queues.values()[0], self.logger,
+                                            app_config["ingest"]["workers"], app_config["ingest"]["high_water"],
+                                            app_config["ingest"]["low_water"])
+        self.input_watcher = InputWatcher(app_config["dirs"]["input"], self.ingestion_pool.submit, self.logger,
+                                          app_config["sleep"]["input"])
+        self.finished_consumer = QueueConsumer(self.finished_queue, self.finish, self.logger,
+                                               app_config["queue"]["timeout"])
+        # A job whose lease keeps expiring kills its slaves, and is given up like a failing job
+        self.lease_reaper = LeaseReaper(self.stage_queues.values(), self.logger, app_config["queue"]["lease"],
+                                        app_config["queue"]["reaper"], app_config["commands"]["tries"], self.abandon)
 
         self.config = app_config
         self.input = app_config["dirs"]["input"]
@@ -52,55 +78,124 @@ class Master(StoppableThread):
 
     def run(self):
         self.log_writer.start()
+        self.lease_reaper.start()
         self.logger.info("Starting master...")
 
-        # processed_filenames = []
+        # Finished jobs are moved to the output directory as soon as they are pushed
+        self.finished_consumer.start()
+
+        # Incoming files are put in the queue as soon as they are written
+        self.ingestion_pool.start()
+        self.input_watcher.start()
 
         while not self.is_stopped():
-            self.logger.info("Reading input directory...")
-            # filenames = [f for f in listdir(self.input) if f not in processed_filenames]
-            filenames = listdir(self.input)
+            self.log_queue_depths()
+            sleep(self.config["sleep"]["master"])  # Avoid CPU consuption while waiting
 
-            if len(filenames) > 0:
-                self.logger.info(str(len(filenames)) + " file(s) to put in the queue")
+    def ingest(self, full_filename):
+        """Move an incoming file to its data directory and put it in the queue
 
-                for filename in filenames:
-                    self.logger.debug("Processing %s..." % filename)
-                    full_filename = join(self.input, filename)
-                    dirname = create_data_directory(full_filename, self.config["dirs"]["temp"])
-                    self.logger.debug("%s has been created." % dirname)
+        Parameters
+            full_filename (str): Path of the incoming file
+        """
+        filename = split(full_filename)[1]
 
-                    if dirname is not None:
-                        # archive = zip_directory(dirname)
+        if not isfile(full_filename):  # Already ingested or removed in the meantime
+            return
 
-                        # self.fman.store_file(archive)
-                        self.command_queue.push(CommandQueueItem(filename=dirname, logger=self.logger,
-                                                                 config=self.config))
+        if not full_filename.endswith(".pdf"):  # Only PDF files are processed, no need to read the others
+            return
 
-                    # processed_filenames.append(filename)
-                    self.logger.info("Incoming files have been put in the queue")
+        self.logger.debug("Processing %s..." % filename)
+        file_hash = file_checksum(full_filename)
+        dirname = create_data_directory(full_filename, self.config["dirs"]["temp"], file_hash)
+        self.logger.debug("%s has been created." % dirname)
 
-            if len(self.finished_queue) > 0:
-                self.logger.info("Finished queue not empty")
+        if dirname is None:
+            return
 
-                while not self.finished_queue.is_empty():
-                    filename = self.finished_queue.pop()
-                    # self.fman.retrieve_file(filename)
+        if self.dedup is not None:
+            status, location = self.dedup.claim(file_hash, dirname)
 
-                    output_file_path = join(self.config["dirs"]["output"], split(filename)[1])
-                    if exists(output_file_path):
-                        remove(output_file_path)
+            # Results of the document have been removed from the output directory
+            if status == "done" and not exists(location):
+                self.dedup.forget(file_hash)
+                status, location = self.dedup.claim(file_hash, dirname)
 
-                    move(filename, self.config["dirs"]["output"])
-                    # self.fman.delete_file(filename)
+            if status == "done":
+                self.logger.info("%s has already been processed in %s" % (filename, location))
+                link_outputs(location, dirname)
+                self.finish(dirname)
+                return
 
-                self.logger.info("No more finished job to process")
+            if status == "waiting":
+                self.logger.info("%s is already being processed in %s" % (filename, location))
+                return
 
-            sleep(self.config["sleep"]["master"])  # Avoid CPU consuption while waiting
+        # archive = zip_directory(dirname)
+
+        # self.fman.store_file(archive)
+        jobs = create_jobs(dirname, self.logger, self.config)
+        self.stage_queues[jobs[0].get_stage()].push_many(jobs)
+
+        self.logger.info("%s has been put in the queue" % filename)
+
+    def finish(self, dirname):
+        """Move a processed data directory to the output directory, along with its waiting duplicates
+
+        Parameters
+            dirname (str): Data directory
+        """
+        # self.fman.retrieve_file(dirname)
+        output_file_path = move_directory(dirname, self.config["dirs"]["output"])
+        self.logger.info("%s is done" % split(dirname)[1])
+
+        if self.dedup is None:
+            return
+
+        for duplicate in self.dedup.complete(dirname, output_file_path):
+            self.logger.info("%s is a duplicate of %s" % (duplicate, output_file_path))
+
+            try:
+                link_outputs(output_file_path, duplicate)
+                self.finish(duplicate)
+            except Exception, e:
+                self.logger.error("Cannot copy the results to %s: %s" % (duplicate, str(e)))
+
+    def abandon(self, cmd_json):
+        """Give up a job whose slaves keep dying, and put in the queue a duplicate submitted in the meantime
+
+        Parameters
+            cmd_json (str): JSON of the job
+        """
+        if self.dedup is None:
+            return
+
+        filename = json.loads(cmd_json)["filename"]
+        duplicate = self.dedup.abandon(filename)
+
+        if duplicate is None:
+            return
+
+        self.logger.info("Processing %s instead of %s" % (duplicate, filename))
+
+        jobs = create_jobs(duplicate, self.logger, self.config)
+        self.stage_queues[jobs[0].get_stage()].push_many(jobs)
+
+    def log_queue_depths(self):
+        """Log the number of jobs waiting for every stage
+        """
+        depths = ["%s: %d" % (stage, len(queue)) for stage, queue in self.stage_queues.items()]
+        self.logger.info("Jobs per stage: " + ", ".join(depths))
 
     def stop(self):
         self.logger.info("Master stopped")
 
+        self.input_watcher.stop()
+        self.ingestion_pool.stop()
+        self.finished_consumer.stop()
+        self.lease_reaper.stop()
+        self.logger.close()
         self.log_writer.stop()
         StoppableThread.stop(self)
 
@@ -119,46 +214,281 @@ class Slave(StoppableThread):
         redis_ip = app_config["redis"]["host"]
         redis_port = app_config["redis"]["port"]
 
+        use_backend(app_config)
+
         self.command_queue = QueueManager(host=redis_ip, port=redis_port, qname="commands")
+        self.stage_queues = get_stage_queues(app_config, redis_ip, redis_port)
         self.finished_queue = QueueManager(host=redis_ip, port=redis_port, qname="finished")
         # self.fman = FileManager(master_ip, master_queue_port)
+        self.dedup = DedupIndex(host=redis_ip, port=redis_port) if app_config["ingest"]["dedup"] else None
 
         slave_ip = gethostbyname(gethostname())
         slave_pid = getpid()
         uid = slave_ip + "::" + str(slave_pid)
 
-        self.logger = AppLogger(uid, logging.getLogger("local"), redis_ip, redis_port)
+        self.logger = AppLogger(uid, logging.getLogger("local"), redis_ip, redis_port,
+                                logging.getLevelName(app_config["log"]["level"]), app_config["log"]["batch"],
+                                app_config["log"]["flush"])
         self.max_tries = app_config["commands"]["tries"]
 
-        self.logger.info("Slave initiated [redis on "+redis_ip+"]")
+        # Stages handled by the slave (most advanced first) and their concurrency limit on the machine
+        stage_limits = app_config["slave"]["stages"] or {}
+        self.stages = [stage for stage in reversed(self.stage_queues.keys())
+                       if len(stage_limits) == 0 or stage in stage_limits]
+        self.semaphores = {stage: get_host_semaphore(app_config["slave"]["locks"], stage, limit)
+                           for stage, limit in stage_limits.items() if limit}
+        self.current_stage = None
+
+        for stage in stage_limits.keys():
+            if stage not in self.stage_queues:
+                raise ValueError("Stage %s is not in the command list" % stage)
+
+        # Jobs being processed are kept in a list owned by this slave
+        self.processing_queues = {stage: self.stage_queues[stage].queue_name + ":processing:" + uid
+                                  for stage in self.stages}
+        self.blocking = app_config["queue"]["blocking"]
+        self.timeout = app_config["queue"]["timeout"]
+        self.lease_duration = app_config["queue"]["lease"]
+
+        self.logger.info("Slave initiated [redis on "+redis_ip+"; stages: "+", ".join(self.stages)+"]")
 
     def run(self):
         self.logger.info("Starting slave...")
 
         while not self.is_stopped():
-            if not self.command_queue.is_empty():
-                cmd_json = self.command_queue.pop()
-                self.logger.debug("CommandQueueItem(jsondata=%s, ...)" % str(cmd_json))
+            if self.blocking:
+                # Wake up as soon as a job is available, and periodically to check the stop flag
+                job = self.pop(self.timeout)
+
+                if job is not None:
+                    self.process(*job)
+            else:
+                job = self.pop()
+
+                if job is not None:
+                    # Start the job after waiting sync between master and worker
+                    sleep(self.config["sleep"]["job"])
+                    self.process(*job)
+
+                sleep(self.config["sleep"]["worker"])  # Avoid CPU consumption while waiting
+
+        # Messages logged while the last job was finishing
+        self.logger.close()
+
+    def pop(self, timeout=None):
+        """Pop a job from the queues of the stages handled by the slave, most advanced stages first
+
+        Parameters
+            timeout (int): Maximum number of seconds to wait for a job, None to return immediately
+
+        Returns
+            tuple: Stage and JSON of the job, None if no job is available
+        """
+        for stage in self.stages:
+            cmd_json = self.pop_stage(stage)
+
+            if cmd_json is not None:
+                return stage, cmd_json
+
+        if timeout is None:
+            return None
+
+        # Wait on every stage whose limit allows one more job on the machine, with a single blocking call
+        stages = [stage for stage in self.stages if stage not in self.semaphores or self.semaphores[stage].acquire()]
+
+        if len(stages) == 0:
+            sleep(timeout)  # The machine is already running as many jobs of every stage as allowed
+            return None
+
+        popped = leased_pop_any([self.stage_queues[stage] for stage in stages],
+                                [self.processing_queues[stage] for stage in stages], self.lease_duration, timeout)
+        popped_stage = None
+
+        if popped is not None:
+            popped_stage = [stage for stage in stages if self.stage_queues[stage] is popped[0]][0]
+
+        # Slots of the stages without job are given back
+        for stage in stages:
+            if stage != popped_stage and stage in self.semaphores:
+                self.semaphores[stage].release()
+
+        if popped is None:
+            return None
+
+        self.current_stage = popped_stage
+        return popped_stage, popped[1]
+
+    def pop_stage(self, stage, timeout=None):
+        """Pop a job from the queue of a stage if the concurrency limit of the stage allows it
+
+        Parameters
+            stage (str): Name of the stage
+            timeout (int): Maximum number of seconds to wait for a job, None to return immediately
+
+        Returns
+            str: JSON of the job, None if no job is available
+        """
+        if not self.acquire_stage(stage):
+            return None
+
+        cmd_json = self.stage_queues[stage].leased_pop(self.processing_queues[stage], self.lease_duration, timeout)
+
+        if cmd_json is None:
+            self.release_stage()
+
+        return cmd_json
+
+    def acquire_stage(self, stage):
+        """Take a slot of a stage on the machine
+
+        Parameters
+            stage (str): Name of the stage
+
+        Returns
+            bool: True if the slave can run a job of this stage
+        """
+        if stage in self.semaphores and not self.semaphores[stage].acquire():
+            return False
+
+        self.current_stage = stage
+        return True
+
+    def release_stage(self):
+        """Release the slot of the current stage
+        """
+        if self.current_stage in self.semaphores:
+            self.semaphores[self.current_stage].release()
+
+        self.current_stage = None
+
+    def process(self, stage, cmd_json):
+        """Execute the current step of a job and push it to the next queue
+
+        Parameters
+            stage (str): Stage the job has been popped from
+            cmd_json (str): JSON of the job, as stored in the processing queue
+        """
+        queue = self.stage_queues[stage]
+        processing_queue = self.processing_queues[stage]
+
+        renewer = LeaseRenewer(queue, processing_queue, cmd_json, self.lease_duration)
+        renewer.start()
+
+        try:
+            self.logger.debug("CommandQueueItem(jsondata=%s, ...)" % str(cmd_json))
+            cmd = CommandQueueItem(jsondata=cmd_json, logger=self.logger, config=self.config)
+            is_part = cmd.pages is not None
+
+            try:
+                status = self.execute(cmd)
+            except Exception:  # Crashing step, counted as a failed try of the job as it was popped
+                self.logger.error(traceback.format_exc())
+
                 cmd = CommandQueueItem(jsondata=cmd_json, logger=self.logger, config=self.config)
+                cmd.tries += 1
+                status = 1
+        finally:
+            renewer.stop()
+            self.release_stage()
+
+        failed = status == 1 and cmd.tries >= self.max_tries  # Job has reached the limit of tries
+        next_queue, next_json = None, None
+
+        if not failed and status != 2:
+            next_queue, next_json = self.get_next_queue(cmd)
+
+        # Releasing the lease, pushing the next state and removing the job from the processing queue happen at once
+        if not queue.complete(processing_queue, cmd_json, next_queue, next_json):
+            # The lease expired and the job has been given to another slave
+            self.logger.warning("Lease lost on %s, discarding the result" % cmd.filename)
+            return
+
+        if is_part and cmd.pages is None:  # Parts merged by this slave
+            self.command_queue.forget_join(cmd.filename)
+
+        if failed:
+            self.logger.error("Error when processing command")
+            self.abandon(cmd)
+        elif next_queue == self.finished_queue.queue_name:
+            self.logger.info("Job done")
+
+    def execute(self, cmd):
+        """Execute the current step of a job, and the following ones as long as they must run on this slave
+
+        Parameters
+            cmd (:class:`.CommandQueueItem`): Job to execute
+
+        Returns
+            int: 0 if the job must be pushed, 1 if a step has failed, 2 if there is nothing left to push
+        """
+        while True:
+            step = cmd.current_step
+
+            if cmd.execute() == 1:
+                return 1
+
+            if cmd.needs_join():
+                # Only the last part of a document to finish goes further
+                if not self.command_queue.join(cmd.filename, str(cmd.pages), cmd.parts):
+                    self.logger.debug("Waiting for the other parts of %s" % cmd.filename)
+                    return 2
+
+                self.logger.info("Every part of %s has been processed" % cmd.filename)
+
+                if cmd.join() != 0:
+                    self.logger.error("Error when merging the parts of %s" % cmd.filename)
+                    self.abandon(cmd)
+                    return 2
+
+            if not cmd.has_affinity(step):
+                return 0
+
+            # The next step stays local only if this slave is allowed to run it now
+            next_stage = cmd.get_stage()
+
+            if next_stage not in self.stages:
+                return 0
+
+            if next_stage != self.current_stage:
+                self.release_stage()
+
+                if not self.acquire_stage(next_stage):
+                    return 0
+
+            self.logger.debug("Running the next step of %s locally" % cmd.filename)
+
+    def get_next_queue(self, cmd):
+        """Get the queue of the next step of a job
+
+        Parameters
+            cmd (:class:`.CommandQueueItem`): Job to push
+
+        Returns
+            tuple: Name of the queue and object to push in it
+        """
+        if cmd.current_step == -1:
+            return self.finished_queue.queue_name, cmd.filename
+
+        return self.stage_queues[cmd.get_stage()].queue_name, str(cmd)
+
+    def abandon(self, cmd):
+        """Give up a document, and put in the queue a duplicate submitted in the meantime
 
-                # Start the job after waiting sync between master and worker
-                sleep(self.config["sleep"]["job"])
-                status = cmd.execute()
+        Parameters
+            cmd (:class:`.CommandQueueItem`): Job which has failed
+        """
+        if self.dedup is None:
+            return
 
-                # Job returned an error and has reached the limit of tries
-                if status == 1 and cmd.tries >= self.max_tries:
-                    self.logger.error("Error when processing command")
-                    continue
+        duplicate = self.dedup.abandon(cmd.filename)
 
-                if cmd.current_step == -1:
-                    self.logger.info("Pushing to finished queue")
-                    self.finished_queue.push(cmd.filename)
-                    self.logger.info("Job done")
-                    continue
+        if duplicate is None:
+            return
 
-                self.command_queue.push(cmd)
+        self.logger.info("Processing %s instead of %s" % (duplicate, cmd.filename))
 
-            sleep(self.config["sleep"]["worker"])  # Avoid CPU consumption while waiting
+        jobs = create_jobs(duplicate, self.logger, self.config)
+        self.stage_queues[jobs[0].get_stage()].push_many(jobs)
 
     def stop(self):
         self.logger.info("Slave stopped")
@@ -0,0 +1,85 @@
+"""Package defining where the queues are stored
+
+Every backend offers the subset of the redis-py client used by the pipeline. Redis is the only backend shared by
+several machines. The *local* backend keeps the queues in the memory of the master and the *sqlite* backend keeps them
+in a database file, for pipelines running on a single machine.
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+from importlib import import_module
+from os import getpid
+
+backend_modules = {
+    "redis": "pipeline.backends.redis_backend",
+    "local": "pipeline.backends.local",
+    "sqlite": "pipeline.backends.sqlite",
+}
+"""dict: Module defining each backend
+"""
+
+backend_config = {
+    "name": "redis",
+    "settings": None
+}
+"""dict: Backend used by the process and its settings, as selected by :func:`use_backend`
+"""
+
+backends = {}
+"""dict: Backend clients of the process, by (backend name, host, port, db, pid)
+"""
+
+
+def use_backend(app_config, serve=False):
+    """Select the backend of the process from the *queue / backend* configuration
+
+    Parameters
+        app_config (dict): Application configuration
+        serve (bool): Whether the process hosts the queues, for the backends needing it
+
+    Returns
+        object: Server hosting the queues if `serve` is True and the backend needs one, None otherwise
+    """
+    name = app_config["queue"]["backend"]
+
+    if name not in backend_modules:
+        raise ValueError("Unknown queue backend %s" % name)
+
+    backend_config["name"] = name
+    backend_config["settings"] = app_config["queue"][name] if name != "redis" else None
+
+    if not serve:
+        return None
+
+    return import_module(backend_modules[name]).serve(backend_config["settings"])
+
+
+def get_backend(host="127.0.0.1", port=6379, db=0):
+    """Get the backend client of a server, shared by the whole process
+
+    Parameters
+        host (str): Redis host
+        port (int): Redis port
+        db (int): Redis database
+
+    Returns
+        object: Client offering the redis-py interface used by the queues
+    """
+    # Clients are not reused by forked processes
+    key = (backend_config["name"], host, port, db, getpid())
+
+    if key not in backends:
+        backend_module = import_module(backend_modules[backend_config["name"]])
+        backends[key] = backend_module.create(host, port, db, backend_config["settings"])
+
+    return backends[key]
@@ -0,0 +1,152 @@
+"""Common parts of the backends emulating Redis
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+
+
+def to_str(value):
+    """Convert a value the way Redis stores it
+
+    Parameters
+        value (object): Value to store
+
+    Returns
+        str: Stored value
+    """
+    if isinstance(value, str):
+        return value
+
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+
+    return str(value)
+
+
+def normalize_range(length, start, stop):
+    """Convert the bounds of a Redis range to positive indices
+
+    Parameters
+        length (int): Length of the list
+        start (int): First index, negative to count from the end
+        stop (int): Last index (included), negative to count from the end
+
+    Returns
+        tuple: First and last indices, None if the range is empty
+    """
+    if start < 0:
+        start = max(length + start, 0)
+
+    if stop < 0:
+        stop += length
+
+    stop = min(stop, length - 1)
+
+    if start > stop:
+        return None
+
+    return start, stop
+
+
+class Pipeline(object):
+    """Commands sent to a backend at once, as with redis-py pipelines
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.commands = []
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.commands.append((name, args))
+            return self
+
+        return record
+
+    def execute(self):
+        """Run the recorded commands atomically
+
+        Returns
+            list: Result of each command
+        """
+        commands, self.commands = self.commands, []
+        return self.backend.run_pipeline(commands)
+
+
+class Backend(object):
+    """Backend emulating the Redis commands used by the pipeline
+
+    Subclasses implement the list commands (lpush, rpush, rpop, rpoplpush, brpoplpush, llen, lrange, ltrim, lrem), the
+    hash commands (hset, hsetnx, hget, hgetall, hkeys, hlen, hdel), delete and :func:`atomic`. Lua scripts are replaced
+    by their Python version, run atomically.
+    """
+
+    def atomic(self):
+        """Get a context in which the commands are run atomically
+
+        Returns
+            object: Context manager
+        """
+        raise NotImplementedError()
+
+    def register_script(self, script, fallback):
+        """Register a script
+
+        Parameters
+            script (str): Lua source of the script, unused
+            fallback (func): Python version of the script, called with the backend, `keys` and `args`
+
+        Returns
+            func: Callable running the script with `keys` and `args`
+        """
+        def run(keys=None, args=None):
+            return self.run_script(fallback, keys or [], args or [])
+
+        return run
+
+    def run_script(self, fallback, keys, args):
+        """Run the Python version of a script atomically
+
+        Parameters
+            fallback (func): Python version of the script
+            keys (list): Keys given to the script
+            args (list): Arguments given to the script
+
+        Returns
+            object: Result of the script
+        """
+        with self.atomic():
+            return fallback(self, keys, args)
+
+    def pipeline(self, transaction=True):
+        """Create a pipeline. Commands of a pipeline are always run atomically.
+
+        Parameters
+            transaction (bool): Unused
+
+        Returns
+            :class:`Pipeline`: Pipeline of the backend
+        """
+        return Pipeline(self)
+
+    def run_pipeline(self, commands):
+        """Run several commands atomically
+
+        Parameters
+            commands (list): Name and arguments of each command
+
+        Returns
+            list: Result of each command
+        """
+        with self.atomic():
+            return [getattr(self, name)(*args) for name, args in commands]
@@ -0,0 +1,356 @@
+"""Queues stored in the memory of the master, for pipelines running on a single machine
+
+The master serves the queues with a :mod:`multiprocessing` manager, and the slaves of the machine connect to it.
+Queues are lost when the master stops.
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import signal
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+from os import remove
+from os.path import exists
+from threading import RLock, Condition
+from time import time, sleep
+from pipeline.backends.base import Backend, to_str, normalize_range
+
+
+class MemoryStore(Backend):
+    """Lists and hashes kept in memory
+    """
+
+    def __init__(self):
+        self.lock = RLock()
+        self.pushed = Condition(self.lock)
+
+        self.lists = {}  # Stores name -> deque, the head of the list being on the left
+        self.hashes = {}  # Stores name -> dict
+
+    @contextmanager
+    def atomic(self):
+        with self.lock:
+            yield
+
+    def lpush(self, name, *values):
+        with self.lock:
+            values_list = self.lists.setdefault(name, deque())
+            values_list.extendleft(to_str(value) for value in values)
+            self.pushed.notify_all()
+
+            return len(values_list)
+
+    def rpush(self, name, *values):
+        with self.lock:
+            values_list = self.lists.setdefault(name, deque())
+            values_list.extend(to_str(value) for value in values)
+            self.pushed.notify_all()
+
+            return len(values_list)
+
+    def rpop(self, name):
+        with self.lock:
+            values_list = self.lists.get(name)
+
+            if not values_list:
+                return None
+
+            value = values_list.pop()
+
+            if len(values_list) == 0:
+                del self.lists[name]
+
+            return value
+
+    def brpop(self, names, timeout=0):
+        deadline = time() + timeout if timeout else None
+
+        with self.lock:
+            while True:
+                for name in names:
+                    value = self.rpop(name)
+
+                    if value is not None:
+                        return name, value
+
+                remaining = deadline - time() if deadline is not None else None
+
+                if remaining is not None and remaining <= 0:
+                    return None
+
+                self.pushed.wait(remaining)
+
+    def rpoplpush(self, source, destination):
+        with self.lock:
+            value = self.rpop(source)
+
+            if value is not None:
+                self.lpush(destination, value)
+
+            return value
+
+    def brpoplpush(self, source, destination, timeout=0):
+        deadline = time() + timeout if timeout else None
+
+        with self.lock:
+            while True:
+                value = self.rpoplpush(source, destination)
+
+                if value is not None:
+                    return value
+
+                remaining = deadline - time() if deadline is not None else None
+
+                if remaining is not None and remaining <= 0:
+                    return None
+
+                self.pushed.wait(remaining)
+
+    def llen(self, name):
+        with self.lock:
+            return len(self.lists.get(name, ()))
+
+    def lrange(self, name, start, stop):
+        with self.lock:
+            values_list = self.lists.get(name, deque())
+            bounds = normalize_range(len(values_list), start, stop)
+
+            if bounds is None:
+                return []
+
+            return list(values_list)[bounds[0]:bounds[1] + 1]
+
+    def ltrim(self, name, start, stop):
+        with self.lock:
+            values_list = self.lists.get(name, deque())
+            bounds = normalize_range(len(values_list), start, stop)
+
+            if bounds is None:
+                self.lists.pop(name, None)
+            else:
+                self.lists[name] = deque(list(values_list)[bounds[0]:bounds[1] + 1])
+
+            return True
+
+    def lrem(self, name, count, value):
+        with self.lock:
+            values_list = self.lists.get(name)
+            value = to_str(value)
+
+            if not values_list:
+                return 0
+
+            # Removing the first occurrence is the only case needed by the queues
+            if count == 1:
+                try:
+                    values_list.remove(value)
+                except ValueError:
+                    return 0
+
+                return 1
+
+            values = list(values_list) if count >= 0 else list(reversed(values_list))
+            kept = []
+            removed = 0
+
+            for item in values:
+                if item == value and (count == 0 or removed < abs(count)):
+                    removed += 1
+                else:
+                    kept.append(item)
+
+            self.lists[name] = deque(kept if count >= 0 else reversed(kept))
+            return removed
+
+    def hset(self, name, key, value):
+        with self.lock:
+            values_hash = self.hashes.setdefault(name, {})
+            is_new = to_str(key) not in values_hash
+            values_hash[to_str(key)] = to_str(value)
+
+            return int(is_new)
+
+    def hsetnx(self, name, key, value):
+        with self.lock:
+            if to_str(key) in self.hashes.get(name, {}):
+                return 0
+
+            return self.hset(name, key, value)
+
+    def hget(self, name, key):
+        with self.lock:
+            return self.hashes.get(name, {}).get(to_str(key))
+
+    def hgetall(self, name):
+        with self.lock:
+            return dict(self.hashes.get(name, {}))
+
+    def hkeys(self, name):
+        with self.lock:
+            return self.hashes.get(name, {}).keys()
+
+    def hlen(self, name):
+        with self.lock:
+            return len(self.hashes.get(name, {}))
+
+    def hdel(self, name, *keys):
+        with self.lock:
+            values_hash = self.hashes.get(name, {})
+            removed = 0
+
+            for key in keys:
+                if values_hash.pop(to_str(key), None) is not None:
+                    removed += 1
+
+            if len(values_hash) == 0:
+                self.hashes.pop(name, None)
+
+            return removed
+
+    def delete(self, *names):
+        with self.lock:
+            removed = 0
+
+            for name in names:
+                if self.lists.pop(name, None) is not None or self.hashes.pop(name, None) is not None:
+                    removed += 1
+
+            return removed
+
+
+store_methods = ("lpush", "rpush", "rpop", "brpop", "rpoplpush", "brpoplpush", "llen", "lrange", "ltrim", "lrem",
+                 "hset", "hsetnx", "hget", "hgetall", "hkeys", "hlen", "hdel", "delete", "run_script", "run_pipeline")
+"""tuple: Methods of the store available to the clients
+"""
+
+memory_store = None
+"""MemoryStore: Store of the server process
+"""
+
+
+def get_memory_store():
+    """Get the store of the server process
+
+    Returns
+        :class:`MemoryStore`: Store shared by every client
+    """
+    global memory_store
+
+    if memory_store is None:
+        memory_store = MemoryStore()
+
+    return memory_store
+
+
+class StoreManager(BaseManager):
+    """Manager serving the memory store
+    """
+    pass
+
+
+StoreManager.register("get_store", callable=get_memory_store, exposed=store_methods)
+
+
+class LocalBackend(Backend):
+    """Client of the store served by the master
+    """
+
+    def __init__(self, address, authkey, retries=30):
+        manager = StoreManager(address=address, authkey=authkey)
+
+        # The slaves may start before the master
+        for attempt in xrange(retries):
+            try:
+                manager.connect()
+                break
+            except IOError:
+                if attempt == retries - 1:
+                    raise
+
+                sleep(1)
+
+        self.store = manager.get_store()
+
+    def __getattr__(self, name):
+        if name not in store_methods:
+            raise AttributeError(name)
+
+        return getattr(self.store, name)
+
+    def lpush(self, name, *values):
+        return self.store.lpush(name, *[to_str(value) for value in values])
+
+    def rpush(self, name, *values):
+        return self.store.rpush(name, *[to_str(value) for value in values])
+
+    def run_script(self, fallback, keys, args):
+        return self.store.run_script(fallback, keys, [to_str(arg) for arg in args])
+
+    def run_pipeline(self, commands):
+        return self.store.run_pipeline(commands)
+
+
+def get_address(settings):
+    """Get the address of the server
+
+    Parameters
+        settings (dict): Settings of the backend
+
+    Returns
+        object: Path of a Unix socket, or (host, port) tuple
+    """
+    address = settings["address"]
+
+    if ":" in address and not address.startswith("/"):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+
+    return address
+
+
+def create(host, port, db, settings):
+    """Connect to the store of the master
+
+    Parameters
+        host (str): Unused
+        port (int): Unused
+        db (int): Unused
+        settings (dict): Settings of the backend
+
+    Returns
+        :class:`LocalBackend`: Client of the store
+    """
+    return LocalBackend(get_address(settings), str(settings["authkey"]))
+
+
+def serve(settings):
+    """Start the process serving the store
+
+    Parameters
+        settings (dict): Settings of the backend
+
+    Returns
+        :class:`StoreManager`: Manager of the server process, to shut down once the master has stopped
+    """
+    address = get_address(settings)
+
+    # Socket left by a previous master
+    if isinstance(address, str) and exists(address):
+        remove(address)
+
+    manager = StoreManager(address=address, authkey=str(settings["authkey"]))
+    # Ctrl+C is received by the whole process group, and the queues must outlive the master while it stops
+    manager.start(signal.signal, (signal.SIGINT, signal.SIG_IGN))
+
+    return manager
@@ -0,0 +1,57 @@
+"""Queues stored in a Redis server
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import redis
+
+
+class RedisBackend(redis.StrictRedis):
+    """Redis client running the Lua version of the scripts
+    """
+
+    def register_script(self, script, fallback=None):
+        """Register a Lua script
+
+        Parameters
+            script (str): Lua source of the script
+            fallback (func): Python version of the script, unused
+
+        Returns
+            func: Callable running the script with `keys` and `args`
+        """
+        return redis.StrictRedis.register_script(self, script)
+
+
+def create(host, port, db, settings):
+    """Create a client. Every client has its own connection pool, reset by redis-py in forked processes.
+
+    Parameters
+        host (str): Redis host
+        port (int): Redis port
+        db (int): Redis database
+        settings (dict): Unused
+
+    Returns
+        :class:`RedisBackend`: Redis client
+    """
+    return RedisBackend(host, port, db)
+
+
+def serve(settings):
+    """Redis is started separately
+
+    Parameters
+        settings (dict): Unused
+    """
+    return None
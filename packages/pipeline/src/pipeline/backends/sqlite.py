@@ -0,0 +1,279 @@
+"""Queues stored in an SQLite database, for pipelines running on a single machine
+
+The database uses write-ahead logging, so that the slaves reading the queues do not block the ones writing to them.
+Queues survive a restart of the pipeline.
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import sqlite3
+from contextlib import contextmanager
+from threading import local
+from time import time, sleep
+from pipeline.backends.base import Backend, to_str, normalize_range
+
+schema = [
+    "CREATE TABLE IF NOT EXISTS lists (name TEXT NOT NULL, pos INTEGER NOT NULL, value TEXT NOT NULL, "
+    "PRIMARY KEY (name, pos))",
+    "CREATE INDEX IF NOT EXISTS lists_values ON lists (name, value)",
+    "CREATE TABLE IF NOT EXISTS hashes (name TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, "
+    "PRIMARY KEY (name, field))",
+]
+"""list: Tables of the database. The head of a list has the lowest position.
+"""
+
+
+class SqliteBackend(Backend):
+    """Lists and hashes stored in an SQLite database
+    """
+
+    def __init__(self, path, poll_interval=0.1):
+        self.path = path
+        self.poll_interval = poll_interval  # Maximum time between two checks of an empty list by a blocking pop
+        self.local = local()  # Every thread has its own connection
+
+        with self.atomic() as connection:
+            for statement in schema:
+                connection.execute(statement)
+
+    def get_connection(self):
+        """Get the connection of the current thread
+
+        Returns
+            :class:`sqlite3.Connection`: Connection to the database
+        """
+        if getattr(self.local, "connection", None) is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.text_factory = str
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+
+            self.local.connection = connection
+            self.local.depth = 0
+
+        return self.local.connection
+
+    @contextmanager
+    def atomic(self):
+        connection = self.get_connection()
+
+        # Nested calls are part of the outermost transaction
+        if self.local.depth == 0:
+            connection.execute("BEGIN IMMEDIATE")
+
+        self.local.depth += 1
+
+        try:
+            yield connection
+        except:
+            self.local.depth -= 1
+
+            if self.local.depth == 0:
+                connection.execute("ROLLBACK")
+
+            raise
+
+        self.local.depth -= 1
+
+        if self.local.depth == 0:
+            connection.execute("COMMIT")
+
+    def push(self, name, values, head):
+        """Add values at one end of a list
+
+        Parameters
+            name (str): Name of the list
+            values (list): Values to add, in order
+            head (bool): True to add them at the head, False at the tail
+
+        Returns
+            int: Length of the list
+        """
+        with self.atomic() as connection:
+            if head:
+                pos = connection.execute("SELECT MIN(pos) FROM lists WHERE name = ?", (name,)).fetchone()[0]
+                positions = [(pos or 0) - i - 1 for i in xrange(len(values))]
+            else:
+                pos = connection.execute("SELECT MAX(pos) FROM lists WHERE name = ?", (name,)).fetchone()[0]
+                positions = [(pos or 0) + i + 1 for i in xrange(len(values))]
+
+            connection.executemany("INSERT INTO lists (name, pos, value) VALUES (?, ?, ?)",
+                                   [(name, p, to_str(v)) for p, v in zip(positions, values)])
+
+            return self.llen(name)
+
+    def lpush(self, name, *values):
+        return self.push(name, values, True)
+
+    def rpush(self, name, *values):
+        return self.push(name, values, False)
+
+    def rpop(self, name):
+        with self.atomic() as connection:
+            row = connection.execute("SELECT pos, value FROM lists WHERE name = ? ORDER BY pos DESC LIMIT 1",
+                                     (name,)).fetchone()
+
+            if row is None:
+                return None
+
+            connection.execute("DELETE FROM lists WHERE name = ? AND pos = ?", (name, row[0]))
+            return row[1]
+
+    def brpop(self, names, timeout=0):
+        deadline = time() + timeout if timeout else None
+        delay = 0.005
+
+        while True:
+            for name in names:
+                value = self.rpop(name)
+
+                if value is not None:
+                    return name, value
+
+            if deadline is not None and time() >= deadline:
+                return None
+
+            sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+
+    def rpoplpush(self, source, destination):
+        with self.atomic():
+            value = self.rpop(source)
+
+            if value is not None:
+                self.lpush(destination, value)
+
+            return value
+
+    def brpoplpush(self, source, destination, timeout=0):
+        deadline = time() + timeout if timeout else None
+        delay = 0.005
+
+        while True:
+            value = self.rpoplpush(source, destination)
+
+            if value is not None:
+                return value
+
+            if deadline is not None and time() >= deadline:
+                return None
+
+            sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+
+    def llen(self, name):
+        return self.get_connection().execute("SELECT COUNT(*) FROM lists WHERE name = ?", (name,)).fetchone()[0]
+
+    def lrange(self, name, start, stop):
+        with self.atomic() as connection:
+            bounds = normalize_range(self.llen(name), start, stop)
+
+            if bounds is None:
+                return []
+
+            rows = connection.execute("SELECT value FROM lists WHERE name = ? ORDER BY pos LIMIT ? OFFSET ?",
+                                      (name, bounds[1] - bounds[0] + 1, bounds[0]))
+            return [row[0] for row in rows]
+
+    def ltrim(self, name, start, stop):
+        with self.atomic() as connection:
+            bounds = normalize_range(self.llen(name), start, stop)
+
+            if bounds is None:
+                connection.execute("DELETE FROM lists WHERE name = ?", (name,))
+            else:
+                connection.execute("DELETE FROM lists WHERE name = ? AND pos NOT IN "
+                                   "(SELECT pos FROM lists WHERE name = ? ORDER BY pos LIMIT ? OFFSET ?)",
+                                   (name, name, bounds[1] - bounds[0] + 1, bounds[0]))
+
+            return True
+
+    def lrem(self, name, count, value):
+        with self.atomic() as connection:
+            order = "ASC" if count >= 0 else "DESC"
+            rows = connection.execute("SELECT pos FROM lists WHERE name = ? AND value = ? ORDER BY pos %s LIMIT ?"
+                                      % order, (name, to_str(value), abs(count) or -1)).fetchall()
+
+            connection.executemany("DELETE FROM lists WHERE name = ? AND pos = ?", [(name, row[0]) for row in rows])
+            return len(rows)
+
+    def hset(self, name, key, value):
+        with self.atomic() as connection:
+            is_new = self.hget(name, key) is None
+            connection.execute("INSERT OR REPLACE INTO hashes (name, field, value) VALUES (?, ?, ?)",
+                               (name, to_str(key), to_str(value)))
+
+            return int(is_new)
+
+    def hsetnx(self, name, key, value):
+        with self.atomic() as connection:
+            return connection.execute("INSERT OR IGNORE INTO hashes (name, field, value) VALUES (?, ?, ?)",
+                                      (name, to_str(key), to_str(value))).rowcount
+
+    def hget(self, name, key):
+        row = self.get_connection().execute("SELECT value FROM hashes WHERE name = ? AND field = ?",
+                                            (name, to_str(key))).fetchone()
+        return row[0] if row is not None else None
+
+    def hgetall(self, name):
+        rows = self.get_connection().execute("SELECT field, value FROM hashes WHERE name = ?", (name,))
+        return dict(rows.fetchall())
+
+    def hkeys(self, name):
+        rows = self.get_connection().execute("SELECT field FROM hashes WHERE name = ?", (name,))
+        return [row[0] for row in rows]
+
+    def hlen(self, name):
+        return self.get_connection().execute("SELECT COUNT(*) FROM hashes WHERE name = ?", (name,)).fetchone()[0]
+
+    def hdel(self, name, *keys):
+        with self.atomic() as connection:
+            return sum(connection.execute("DELETE FROM hashes WHERE name = ? AND field = ?",
+                                          (name, to_str(key))).rowcount for key in keys)
+
+    def delete(self, *names):
+        with self.atomic() as connection:
+            removed = 0
+
+            for name in names:
+                deleted_rows = connection.execute("DELETE FROM lists WHERE name = ?", (name,)).rowcount
+                deleted_rows += connection.execute("DELETE FROM hashes WHERE name = ?", (name,)).rowcount
+
+                if deleted_rows > 0:
+                    removed += 1
+
+            return removed
+
+
+def create(host, port, db, settings):
+    """Open the database
+
+    Parameters
+        host (str): Unused
+        port (int): Unused
+        db (int): Unused
+        settings (dict): Settings of the backend
+
+    Returns
+        :class:`SqliteBackend`: Client of the database
+    """
+    return SqliteBackend(settings["path"])
+
+
+def serve(settings):
+    """The database is opened by every process
+
+    Parameters
+        settings (dict): Unused
+    """
+    return None
@@ -0,0 +1,122 @@
+"""Package processing a directory of PDF files on the local machine, without master, slaves nor queues
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import logging
+import traceback
+from multiprocessing import Pool, cpu_count
+from os import listdir, makedirs
+from os.path import join, isfile, exists, basename
+from time import time
+from pipeline.commands import get_command
+from pipeline.queue import CommandQueueItem, parse_command_list
+from pipeline.utils import create_data_directory, move_directory
+
+worker_config = {}
+"""dict: Configuration of the worker process, set by :func:`init_worker`
+"""
+
+
+def init_worker(app_config):
+    """Load the data used by the commands, once per worker process
+
+    Parameters:
+        app_config (dict): Application configuration
+    """
+    worker_config.update(app_config)
+
+    for cmd_name, cmd_params in parse_command_list(app_config):
+        get_command(cmd_name).preload(app_config)
+
+
+def process_file(args):
+    """Run every step of the command list on a PDF file
+
+    Parameters:
+        args (tuple): Path of the PDF file and output directory
+
+    Returns:
+        tuple: Name of the file, error message (None on success) and processing time
+    """
+    filename, output_dir = args
+    logger = logging.getLogger("local")
+    start = time()
+
+    try:
+        # The input directory is left untouched
+        dirname = create_data_directory(filename, worker_config["dirs"]["temp"], copy=True)
+        cmd = CommandQueueItem(filename=dirname, logger=logger, config=worker_config)
+
+        while cmd.current_step != -1:
+            stage = cmd.get_stage()
+
+            if cmd.execute() == 1 and cmd.tries >= worker_config["commands"]["tries"]:
+                return basename(filename), "%s has failed" % stage, time() - start
+
+        move_directory(dirname, output_dir)
+    except Exception:
+        logger.error(traceback.format_exc())
+        return basename(filename), traceback.format_exc().splitlines()[-1], time() - start
+
+    return basename(filename), None, time() - start
+
+
+def process_directory(app_config, input_dir, output_dir, jobs=0):
+    """Process every PDF file of a directory with a pool of processes
+
+    Parameters:
+        app_config (dict): Application configuration
+        input_dir (str): Directory containing the PDF files
+        output_dir (str): Directory receiving the data directory of every file
+        jobs (int): Number of files processed at the same time (0 for one per core)
+
+    Returns:
+        int: Number of files which could not be processed
+    """
+    pdf_files = sorted([join(input_dir, f) for f in listdir(input_dir)
+                        if isfile(join(input_dir, f)) and f.endswith(".pdf")])
+
+    for directory in (output_dir, app_config["dirs"]["temp"]):
+        if not exists(directory):
+            makedirs(directory)
+
+    jobs = jobs if jobs > 0 else cpu_count()
+    app_config["slave"]["workers"] = jobs
+    print "Processing %d file(s) with %d process(es)..." % (len(pdf_files), jobs)
+
+    pool = Pool(jobs, init_worker, (app_config,))
+    failures = 0
+    start = time()
+
+    try:
+        results = pool.imap_unordered(process_file, [(f, output_dir) for f in pdf_files])
+
+        for index, (filename, error, duration) in enumerate(results):
+            if error is None:
+                status = "done in %.1fs" % duration
+            else:
+                status = "FAILED (%s)" % error
+                failures += 1
+
+            print "[%d/%d] %s %s" % (index + 1, len(pdf_files), filename, status)
+
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    print "%d file(s) processed in %.1fs, %d failure(s)" % (len(pdf_files) - failures, time() - start, failures)
+    return failures
@@ -0,0 +1,277 @@
+"""Package storing the results of the steps, to avoid computing them again for identical inputs
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import json
+from os import makedirs, getpid, rename, remove, stat, utime, walk
+from os.path import join, exists, isfile, dirname, basename, relpath
+from shutil import copyfile
+from time import time
+from apputils.fileop import file_checksum
+
+BASE_PLACEHOLDER = "@"
+"""str: Replaces the name of the document in the stored filenames, so that documents with different names share results
+"""
+
+PRUNE_INTERVAL = 600
+"""int: Minimum number of seconds between two prunings of a store
+"""
+
+
+def to_cache_name(filename, base_filename):
+    """Make a path independent from the name of the document
+
+    Parameters:
+        filename (str): Path relative to the data directory
+        base_filename (str): Name of the document
+
+    Returns:
+        str: Path with the name of the document replaced by the placeholder
+    """
+    head, tail = dirname(filename), basename(filename)
+
+    if tail.startswith(base_filename):
+        tail = BASE_PLACEHOLDER + tail[len(base_filename):]
+
+    return join(head, tail)
+
+
+def from_cache_name(filename, base_filename):
+    """Restore the name of the document in a path
+
+    Parameters:
+        filename (str): Path with the placeholder, relative to the data directory
+        base_filename (str): Name of the document
+
+    Returns:
+        str: Path relative to the data directory
+    """
+    head, tail = dirname(filename), basename(filename)
+
+    if tail.startswith(BASE_PLACEHOLDER):
+        tail = base_filename + tail[len(BASE_PLACEHOLDER):]
+
+    return join(head, tail)
+
+
+def make_parent_dir(filename):
+    """Create the parent directory of a file if needed
+
+    Parameters:
+        filename (str): Path of the file
+    """
+    parent_dir = dirname(filename)
+
+    if not exists(parent_dir):
+        try:
+            makedirs(parent_dir)
+        except OSError:  # Created by another process in the meantime
+            pass
+
+
+def atomic_copy(source, destination):
+    """Copy a file so that other processes never see it partially written
+
+    Parameters:
+        source (str): Path of the file to copy
+        destination (str): Path of the copy
+    """
+    make_parent_dir(destination)
+
+    tmp_destination = "%s.%d.tmp" % (destination, getpid())
+    copyfile(source, tmp_destination)
+    rename(tmp_destination, destination)
+
+
+def touch(filename):
+    """Mark a stored file as used, so that it is pruned last
+
+    Parameters:
+        filename (str): Path of the file
+    """
+    try:
+        utime(filename, None)
+    except OSError:  # Pruned in the meantime
+        pass
+
+
+def prune(directories, max_size, interval=PRUNE_INTERVAL):
+    """Remove the least recently used files of directories until their total size is under a limit
+
+    The files are listed at most once per `interval` seconds, the time of the last pruning being shared by the
+    processes of the machine through a stamp in the first directory.
+
+    Parameters:
+        directories (list): Directories to prune
+        max_size (int): Maximum size in bytes, 0 for no limit
+        interval (int): Minimum number of seconds between two prunings
+
+    Returns:
+        int: Number of files removed
+    """
+    if max_size <= 0:
+        return 0
+
+    stamp_filename = join(directories[0], ".pruned")
+
+    try:
+        if time() - stat(stamp_filename).st_mtime < interval:
+            return 0
+    except OSError:  # Never pruned
+        pass
+
+    make_parent_dir(stamp_filename)
+    open(stamp_filename, "w").close()
+
+    files = []  # Stores (last use, size, path) of every file
+
+    for directory in directories:
+        for root, _, filenames in walk(directory):
+            for filename in filenames:
+                path = join(root, filename)
+
+                try:
+                    file_stat = stat(path)
+                except OSError:  # Removed in the meantime
+                    continue
+
+                if path != stamp_filename and not path.endswith(".tmp"):  # Files being written are left alone
+                    files.append((file_stat.st_mtime, file_stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in files)
+    removed = 0
+
+    for _, size, path in sorted(files):
+        if total_size <= max_size:
+            break
+
+        try:
+            remove(path)
+        except OSError:
+            continue
+
+        total_size -= size
+        removed += 1
+
+    return removed
+
+
+class StageCache(object):
+    """Local content-addressed store of the step results
+
+    Every file is stored once under its checksum in *objects*. The results of a step are listed in an entry, named
+    after the cache key of the step and mapping each output file to its checksum. Files are copied in and out of the
+    store, so that steps rewriting their outputs cannot alter it. The least recently used files are removed once the
+    store exceeds its maximum size.
+    """
+
+    def __init__(self, cache_dir, max_size=0):
+        self.objects_dir = join(cache_dir, "objects")
+        self.entries_dir = join(cache_dir, "entries")
+        self.max_size = max_size  # In bytes, 0 for no limit
+
+    def get_object_path(self, checksum):
+        """Get the location of a stored file
+
+        Parameters:
+            checksum (str): Checksum of the file
+
+        Returns:
+            str: Path of the file in the store
+        """
+        return join(self.objects_dir, checksum[0:2], checksum)
+
+    def get_entry_path(self, key):
+        """Get the location of the entry of a cache key
+
+        Parameters:
+            key (str): Cache key
+
+        Returns:
+            str: Path of the entry in the store
+        """
+        return join(self.entries_dir, key[0:2], key + ".json")
+
+    def store(self, key, data_dir, base_filename, files):
+        """Store the results of a step
+
+        Parameters:
+            key (str): Cache key of the step
+            data_dir (str): Data directory of the document
+            base_filename (str): Name of the document
+            files (list): Paths of the result files
+        """
+        entry = {}
+
+        for filename in files:
+            checksum = file_checksum(filename)
+            object_path = self.get_object_path(checksum)
+
+            if not exists(object_path):
+                atomic_copy(filename, object_path)
+            else:
+                touch(object_path)
+
+            entry[to_cache_name(relpath(filename, data_dir), base_filename)] = checksum
+
+        entry_path = self.get_entry_path(key)
+        make_parent_dir(entry_path)
+
+        tmp_entry_path = "%s.%d.tmp" % (entry_path, getpid())
+
+        with open(tmp_entry_path, "w") as entry_file:
+            json.dump(entry, entry_file)
+
+        rename(tmp_entry_path, entry_path)
+
+    def restore(self, key, data_dir, base_filename):
+        """Copy the stored results of a step into a data directory
+
+        Parameters:
+            key (str): Cache key of the step
+            data_dir (str): Data directory of the document
+            base_filename (str): Name of the document
+
+        Returns:
+            bool: True if the results have been restored, False if they are not in the store
+        """
+        entry_path = self.get_entry_path(key)
+
+        if not isfile(entry_path):
+            return False
+
+        with open(entry_path, "r") as entry_file:
+            entry = json.load(entry_file)
+
+        object_paths = {filename: self.get_object_path(checksum) for filename, checksum in entry.items()}
+
+        # Results partially removed from the store are computed again
+        if not all(isfile(object_path) for object_path in object_paths.values()):
+            return False
+
+        for filename, object_path in object_paths.items():
+            atomic_copy(object_path, join(data_dir, from_cache_name(filename, base_filename)))
+            touch(object_path)
+
+        touch(entry_path)
+        return True
+
+    def prune(self):
+        """Remove the least recently used files if the store is too large. Entries whose files have been removed are
+        computed again.
+
+        Returns:
+            int: Number of files removed
+        """
+        return prune([self.objects_dir, self.entries_dir], self.max_size)
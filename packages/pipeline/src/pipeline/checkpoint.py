@@ -0,0 +1,103 @@
+"""Package keeping track of the pages already processed by a step, so that a job retried or taken over by another slave
+only processes the remaining pages
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import json
+from os import getpid, rename, remove, rmdir, stat
+from os.path import join, exists, relpath, dirname
+from threading import Lock
+from pipeline.cache import make_parent_dir
+
+CHECKPOINT_DIR = "checkpoints"
+"""str: Directory of the manifests, in the data directory of the document
+"""
+
+
+class PageCheckpoint(object):
+    """Manifest of the pages processed by a step, stored in the data directory
+
+    Every page is recorded with the size of its result files. A page is only considered as processed if its files still
+    have this size, so that files truncated by a crash are produced again.
+    """
+
+    def __init__(self, data_dir, step_name, pages=None):
+        self.data_dir = data_dir
+        self.lock = Lock()  # Pages can be recorded by several threads
+
+        range_name = "all" if pages is None else "%d-%d" % (pages[0], pages[1])
+        self.filename = join(data_dir, CHECKPOINT_DIR, "%s.%s.json" % (step_name, range_name))
+
+        self.pages = {}  # Stores page -> {file path relative to the data directory -> size}
+
+        if exists(self.filename):
+            try:
+                with open(self.filename, "r") as manifest:
+                    self.pages = {int(page): files for page, files in json.load(manifest).items()}
+            except ValueError:  # Manifest partially written
+                self.pages = {}
+
+    def is_done(self, page):
+        """Check that a page has been processed and that its result files are intact
+
+        Parameters:
+            page (int): Page number
+
+        Returns:
+            bool: True if the page does not need to be processed again
+        """
+        if page not in self.pages:
+            return False
+
+        for filename, size in self.pages[page].items():
+            try:
+                if stat(join(self.data_dir, filename)).st_size != size:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    def add_pages(self, page_files):
+        """Record processed pages
+
+        Parameters:
+            page_files (dict): Paths of the result files of each page
+        """
+        with self.lock:
+            for page, files in page_files.items():
+                self.pages[page] = {relpath(f, self.data_dir): stat(f).st_size for f in files}
+
+            make_parent_dir(self.filename)
+
+            tmp_filename = "%s.%d.tmp" % (self.filename, getpid())
+
+            with open(tmp_filename, "w") as manifest:
+                json.dump(self.pages, manifest)
+
+            rename(tmp_filename, self.filename)
+
+    def clear(self):
+        """Remove the manifest, once the step is done
+        """
+        with self.lock:
+            self.pages = {}
+
+            if exists(self.filename):
+                remove(self.filename)
+
+            try:
+                rmdir(dirname(self.filename))
+            except OSError:  # Manifests of other page ranges
+                pass
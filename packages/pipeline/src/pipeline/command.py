@@ -13,14 +13,26 @@
     National Institute of Standards and Technology
     http://www.nist.gov/itl/ssd/is
 """
-from apputils.fileop import zip_directory, unzip_directory
+import json
+import re
+from hashlib import sha256
+from os import listdir
+from os.path import join, relpath
+from apputils.fileop import zip_directory, unzip_directory, file_checksum
+from pipeline.cache import StageCache, to_cache_name
+from pipeline.checkpoint import PageCheckpoint
 from pipeline.files import FileManager
+from pipeline.utils import get_base_filename
 
 
 class Command(object):
     """Main command object
     """
 
+    page_level = False
+    """bool: Whether the command can process a range of pages independently from the rest of the document
+    """
+
     def __init__(self, filename, logger, app_config):
         self.logger = logger
 
@@ -34,8 +46,173 @@ class Command(object):
         self.unzipped = filename
         self.config = app_config
 
+        # Range [first, last) of pages to process, None for the whole document
+        self.pages = None
+
         self.logger.debug("File to be processed: %s" % str(self.unzipped))
 
+    @classmethod
+    def preload(cls, app_config):
+        """Load the data used by every instance of the command, before the slave processes are forked
+
+        Parameters:
+            app_config (dict): Application configuration
+        """
+        pass
+
+    def join(self):
+        """Merge the results of every page range once they have all been processed
+
+        Returns:
+            int: 0 when no errors happen, >0 otherwise
+        """
+        return 0
+
+    def run(self):
+        """Execute the command, unless its results are already in the cache
+
+        Returns:
+            int: 0 when no errors happen, >0 otherwise
+        """
+        if not self.config["commands"]["cache"]:
+            return self.execute()
+
+        try:
+            cache = StageCache(self.config["dirs"]["cache"], self.config["commands"]["cache_size"] * 1024 * 1024)
+            key = self.cache_key()
+        except Exception, e:
+            self.logger.warning("Cannot compute the cache key of %s: %s" % (self.unzipped, str(e)))
+            key = None
+
+        if key is None:
+            return self.execute()
+
+        base_filename = self.get_base_filename()
+
+        if cache.restore(key, self.unzipped, base_filename):
+            self.logger.info("Results of %s restored from the cache" % self.__class__.__name__)
+            return 0
+
+        cmd_result = self.execute()
+
+        if cmd_result == 0:
+            try:
+                cache.store(key, self.unzipped, base_filename, self.get_cache_outputs())
+                cache.prune()
+            except Exception, e:
+                self.logger.warning("Cannot store the results of %s: %s" % (self.unzipped, str(e)))
+
+        return cmd_result
+
+    def cache_key(self):
+        """Compute the key of the results of the command from its inputs and its parameters
+
+        Returns:
+            str: Key of the results, None if the command cannot be cached
+        """
+        inputs = self.get_cache_inputs()
+
+        if inputs is None:
+            return None
+
+        base_filename = self.get_base_filename()
+        key_data = {
+            "command": self.__class__.__name__,
+            "pages": self.pages,
+            "params": self.get_cache_params(),
+            "inputs": {to_cache_name(relpath(f, self.unzipped), base_filename): file_checksum(f) for f in inputs}
+        }
+
+        return sha256(json.dumps(key_data, sort_keys=True)).hexdigest()
+
+    def get_cache_inputs(self):
+        """List the files read by the command
+
+        Returns:
+            list: Paths of the input files, None if the results of the command must not be cached
+        """
+        return None
+
+    def get_cache_params(self):
+        """Get the parameters changing the results of the command
+
+        Returns:
+            dict: Parameters of the command
+        """
+        return {}
+
+    def get_cache_outputs(self):
+        """List the files written by the command
+
+        Returns:
+            list: Paths of the result files
+        """
+        return []
+
+    def get_base_filename(self):
+        """Get the name of the PDF file without its extension
+
+        Returns:
+            str: Base name of the document
+        """
+        return get_base_filename(self.unzipped)
+
+    def get_page_files(self, png_dir):
+        """List the images of the pages to process
+
+        Parameters:
+            png_dir (str): Directory containing the images of the document
+
+        Returns:
+            dict: Path of the image of each page
+        """
+        page_regexp = re.compile("^%s-([0-9]+)\\.png$" % re.escape(self.get_base_filename()))
+        page_files = {}
+
+        for f in listdir(png_dir):
+            page_match = page_regexp.match(f)
+
+            if page_match is None:
+                continue
+
+            page = int(page_match.group(1))
+
+            if self.pages is None or self.pages[0] <= page < self.pages[1]:
+                page_files[page] = join(png_dir, f)
+
+        return page_files
+
+    def get_text_layer_files(self):
+        """List the text files extracted from the text layer of the PDF file by :class:`.PDFConverter`
+
+        Returns:
+            list: Paths of the text files of the pages in the range of the job
+        """
+        segments_dir = join(self.unzipped, "txt", "segments")
+        text_files = []
+
+        for f in listdir(segments_dir):
+            if not f.endswith("-000000.txt"):
+                continue
+
+            page = int(f.split("-", 1)[0])
+
+            if self.pages is None or self.pages[0] <= page < self.pages[1]:
+                text_files.append(join(segments_dir, f))
+
+        return text_files
+
+    def get_checkpoint(self):
+        """Get the manifest of the pages already processed by the command for this job
+
+        Returns:
+            :class:`.PageCheckpoint`: Manifest of the pages, None if checkpoints are disabled
+        """
+        if self.config["commands"]["checkpoint"] <= 0:
+            return None
+
+        return PageCheckpoint(self.unzipped, self.__class__.__name__, self.pages)
+
     # def get_file(self):
     #     """Retrieve file from redis and unzip it to the local filesystem
     #     """
@@ -13,9 +13,50 @@
     National Institute of Standards and Technology
     http://www.nist.gov/itl/ssd/is
 """
+from importlib import import_module
 
-from pipeline.commands.pdfconverter import *
-from pipeline.commands.pngreader import *
-from pipeline.commands.txtdenoiser import *
+command_modules = {
+    "PDFConverter": "pipeline.commands.pdfconverter",
+    "PNGReader": "pipeline.commands.pngreader",
+    "TXTDenoiser": "pipeline.commands.txtdenoiser",
+    # Put your additional commands here
+}
+"""dict: Module defining each command. A module (and its dependencies) is only imported when its command is first used.
+"""
+
+
+def register_command(name, module):
+    """Register a command defined outside of this package
+
+    Parameters:
+        name (str): Name of the command class, as used in the command list
+        module (str): Module defining the class
+    """
+    command_modules[name] = module
+
+
+def get_command(name):
+    """Get the class of a command, importing its module if needed
+
+    Commands can either be registered in :attr:`command_modules` or given with their full path (`package.module.Class`).
+
+    Parameters:
+        name (str): Name of the command
+
+    Returns:
+        type: Class of the command
+
+    Raises:
+        KeyError: The command is unknown
+    """
+    if name in command_modules:
+        module_name, class_name = command_modules[name], name
+    elif "." in name:
+        module_name, class_name = name.rsplit(".", 1)
+    else:
+        raise KeyError("Command "+name+" is not registered")
 
-# Put your additional commands here
+    try:
+        return getattr(import_module(module_name), class_name)
+    except (ImportError, AttributeError), e:
+        raise KeyError("Command "+name+" cannot be loaded: "+str(e))
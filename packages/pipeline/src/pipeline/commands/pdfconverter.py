@@ -13,27 +13,126 @@
     National Institute of Standards and Technology
     http://www.nist.gov/itl/ssd/is
 """
-from os import listdir
+import codecs
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from os import listdir, rename
 from os.path import join, isfile, dirname, splitext, basename, isdir
+from shutil import rmtree
+from string import punctuation
+from subprocess import check_output, STDOUT
+from tempfile import mkdtemp
 import PyPDF2
-import PythonMagick
 from pipeline.command import Command
 
+ghostscript_devices = {
+    8: "pnggray",
+    16: "png48"
+}
+"""dict: Ghostscript PNG device for each depth: 8-bit grayscale, or 16-bit RGB since Ghostscript has no 16-bit
+grayscale PNG device
+"""
+
+
+def get_page_ranges(pages, max_length):
+    """Group pages into ranges of consecutive pages
+
+    Parameters:
+        pages (list): Sorted indices of the pages
+        max_length (int): Maximum number of pages in a range
+
+    Returns:
+        list: First and last page of each range
+    """
+    ranges = []
+
+    for page in pages:
+        if len(ranges) > 0 and ranges[-1][1] == page - 1 and ranges[-1][1] - ranges[-1][0] + 1 < max_length:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+
+    return ranges
+
+
+def rasterize_ghostscript(filename, page_range, png_prefix, density, depth, ghostscript="gs"):
+    """Convert a range of pages in a single Ghostscript call
+
+    Parameters:
+        filename (str): Path of the PDF file
+        page_range (list): First and last page to convert (0-based)
+        png_prefix (str): Prefix of the PNG files, completed with '-<page>.png'
+        density (int): Resolution in dots per inch
+        depth (int): Bits per color component
+        ghostscript (str): Ghostscript executable
+
+    Raises:
+        ValueError: Ghostscript has no PNG device for the depth
+    """
+    if depth not in ghostscript_devices:
+        raise ValueError("Unsupported depth for Ghostscript: %s (expected %s)"
+                         % (str(depth), ", ".join(str(d) for d in sorted(ghostscript_devices.keys()))))
+
+    first, last = page_range
+    tmp_dir = mkdtemp(dir=dirname(png_prefix))
+
+    try:
+        check_output([
+            ghostscript, "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER",
+            "-sDEVICE=" + ghostscript_devices[depth], "-r" + str(density),
+            "-dTextAlphaBits=4", "-dGraphicsAlphaBits=4",
+            "-dFirstPage=%d" % (first + 1), "-dLastPage=%d" % (last + 1),
+            "-sOutputFile=" + join(tmp_dir, "%d.png"), filename
+        ], stderr=STDOUT)
+
+        # Ghostscript numbers the rendered pages from 1
+        for page in xrange(first, last + 1):
+            rename(join(tmp_dir, "%d.png" % (page - first + 1)), "%s-%d.png" % (png_prefix, page))
+    finally:
+        rmtree(tmp_dir, ignore_errors=True)
+
+
+def rasterize_pythonmagick(filename, page, png_prefix, density, depth, quality):
+    """Convert one page with PythonMagick, which reads the whole PDF file for every page
+
+    Parameters:
+        filename (str): Path of the PDF file
+        page (int): Page to convert (0-based)
+        png_prefix (str): Prefix of the PNG file, completed with '-<page>.png'
+        density (int): Resolution in dots per inch
+        depth (int): Bits per color component
+        quality (int): PNG compression quality
+    """
+    import PythonMagick
+
+    img = PythonMagick.Image()
+    img.density(str(density))
+    img.depth(depth)
+    img.quality(quality)
+
+    img.read(filename + '[' + str(page) + ']')
+    img.write("%s-%d.png" % (png_prefix, page))
+
 
 class PDFConverter(Command):
     """ Command to convert PDF to PNG.
     """
 
+    page_level = True
+
     def __init__(self, filename, logger, config):
         super(PDFConverter, self).__init__(filename, logger, config)
 
         self.density = config["command"]["density"]
         self.depth = config["command"]["depth"]
         self.quality = config["command"]["quality"]
+        self.text_layer = config["command"]["text_layer"]
+        self.rasterizer = config["command"]["rasterizer"]
 
         self.logger.debug("PDF converter {density: "+str(self.density)
                           + "; depth: "+str(self.depth)
-                          + "; quality: "+str(self.quality) + "}")
+                          + "; quality: "+str(self.quality)
+                          + "; text layer: "+str(self.text_layer) + "}")
 
     def execute(self):
         """ Execute the command
@@ -59,35 +158,181 @@ class PDFConverter(Command):
             pdf_filereader = PyPDF2.PdfFileReader(pdf)
             pdf_page_nb = pdf_filereader.getNumPages()
 
+            self.logger.debug(str(pdf_page_nb) + " page(s) detected")
+
+            if self.pages is None:
+                pages = xrange(pdf_page_nb)
+            else:
+                pages = xrange(self.pages[0], min(self.pages[1], pdf_page_nb))
+                self.logger.debug("Converting pages %d to %d" % (self.pages[0], self.pages[1] - 1))
+
+            # Born-digital pages do not need to be read by the OCR
+            if self.text_layer is not None:
+                pages = [p for p in pages if not self.extract_text_layer(pdf_filereader, p)]
+                self.logger.debug("%d page(s) without usable text layer" % len(pages))
+
         pdf_dirname = dirname(filename)
         imagesdir = "png"
+        png_prefix = join(pdf_dirname, imagesdir, splitext(basename(filename))[0])
+
+        # Pages converted before a failure of the job are not converted again
+        checkpoint = self.get_checkpoint()
 
-        self.logger.debug(str(pdf_page_nb) + " page(s) detected")
-        for p in xrange(pdf_page_nb):
+        if checkpoint is not None:
+            pages = [p for p in pages if not checkpoint.is_done(p)]
+            self.logger.debug("%d page(s) left to convert" % len(pages))
 
+        if self.rasterizer["backend"] == "ghostscript":
+            try:
+                self.convert_ghostscript(filename, pages, png_prefix, checkpoint)
+
+                if checkpoint is not None:
+                    checkpoint.clear()
+
+                self.finalize()
+                return 0
+            except OSError, e:  # Ghostscript is not installed
+                self.logger.warning("Cannot run Ghostscript (%s), falling back to PythonMagick" % str(e))
+            except Exception, e:
+                self.logger.fatal("An exception has been caugth: "+str(e))
+                self.finalize()
+                return 1
+
+        for p in pages:
             try:  # Reading the PDF
-                img = PythonMagick.Image()
-                img.density(str(self.density))
-                img.depth(self.depth)
-                img.quality(self.quality)
-
-                pdf_page_file = filename + '[' + str(p) + ']'
-                self.logger.debug("Reading " + pdf_page_file + "...")
-                img.read(pdf_page_file)
-
-                png_dirname = join(pdf_dirname, imagesdir)
-                png_filename = splitext(basename(filename))[0] + '-' + str(p) + '.png'
-                png_page_file = join(png_dirname, png_filename)
-                self.logger.debug("Writing " + png_page_file + "...")
-                img.write(png_page_file)
+                self.logger.debug("Converting page %d of %s..." % (p, filename))
+                rasterize_pythonmagick(filename, p, png_prefix, self.density, self.depth, self.quality)
             except Exception, e:
                 self.logger.fatal("An exception has been caugth: "+str(e.message))
                 self.finalize()
                 return 1
 
+            if checkpoint is not None:
+                checkpoint.add_pages({p: ["%s-%d.png" % (png_prefix, p)]})
+
+        if checkpoint is not None:
+            checkpoint.clear()
+
         self.finalize()
         return 0
 
+    def convert_ghostscript(self, filename, pages, png_prefix, checkpoint=None):
+        """Convert pages with Ghostscript, each range of consecutive pages being rendered in a single call
+
+        Parameters:
+            filename (str): Path of the PDF file
+            pages (list): Pages to convert
+            png_prefix (str): Prefix of the PNG files
+            checkpoint (:class:`.PageCheckpoint`): Manifest recording the pages converted, if any
+        """
+        parallel = self.rasterizer["parallel"] if self.rasterizer["parallel"] > 0 else cpu_count()
+        pages = sorted(pages)
+
+        if len(pages) == 0:
+            return
+
+        # Ranges are split so that every process gets its share of the pages
+        max_length = -(-len(pages) // parallel)
+
+        # and so that a failure only loses the range being converted
+        if checkpoint is not None:
+            max_length = min(max_length, self.config["commands"]["checkpoint"])
+
+        page_ranges = get_page_ranges(pages, max_length)
+        self.logger.debug("Converting %d page(s) in %d range(s)..." % (len(pages), len(page_ranges)))
+
+        def convert_range(page_range):
+            rasterize_ghostscript(filename, page_range, png_prefix, self.density, self.depth,
+                                  self.rasterizer["ghostscript"])
+
+            if checkpoint is not None:
+                first, last = page_range
+                checkpoint.add_pages({p: ["%s-%d.png" % (png_prefix, p)] for p in xrange(first, last + 1)})
+
+        if parallel == 1 or len(page_ranges) == 1:
+            for page_range in page_ranges:
+                convert_range(page_range)
+
+            return
+
+        pool = ThreadPool(min(parallel, len(page_ranges)))
+
+        try:
+            pool.map(convert_range, page_ranges)
+        finally:
+            pool.close()
+            pool.join()
+
+    def extract_text_layer(self, pdf_filereader, page):
+        """Write the text layer of a page as the text of the page, if it is usable
+
+        A text layer is usable if it has at least `min_chars` characters, of which a `min_ratio` proportion are letters,
+        digits, punctuation or spaces (fonts without Unicode mapping produce unreadable characters).
+
+        Parameters:
+            pdf_filereader (:class:`PyPDF2.PdfFileReader`): Reader of the PDF file
+            page (int): Index of the page
+
+        Returns:
+            bool: True if the text has been extracted, False if the page must be converted
+        """
+        try:
+            text = pdf_filereader.getPage(page).extractText()
+        except Exception, e:
+            self.logger.debug("Cannot read the text layer of page %d: %s" % (page, str(e)))
+            return False
+
+        lines = [line.strip() for line in text.splitlines() if len(line.strip()) > 0]
+        chars = "".join(lines)
+
+        if len(chars) == 0 or len(chars) < self.text_layer["min_chars"]:
+            return False
+
+        readable_chars = len([c for c in chars if c.isalnum() or c.isspace() or c in punctuation])
+
+        if float(readable_chars) / len(chars) < self.text_layer["min_ratio"]:
+            return False
+
+        # Named like the line files of the OCR, to be assembled with them
+        segment_filename = join(self.unzipped, "txt", "segments", "%d-000000.txt" % page)
+
+        with codecs.open(segment_filename, "wb", encoding="utf-8") as segment_file:
+            for line in lines:
+                segment_file.write(line+"\n")
+
+        return True
+
+    def get_cache_inputs(self):
+        """List the PDF file
+
+        Returns:
+            list: Paths of the input files
+        """
+        return [join(self.unzipped, self.get_base_filename() + ".pdf")]
+
+    def get_cache_params(self):
+        """Get the conversion parameters
+
+        Returns:
+            dict: Parameters of the command
+        """
+        params = {"density": self.density, "depth": self.depth, "text_layer": self.text_layer,
+                  "rasterizer": self.rasterizer["backend"]}
+
+        # The PNG compression is only set by PythonMagick
+        if self.rasterizer["backend"] != "ghostscript":
+            params["quality"] = self.quality
+
+        return params
+
+    def get_cache_outputs(self):
+        """List the images of the converted pages and the text of the pages with a text layer
+
+        Returns:
+            list: Paths of the result files
+        """
+        return self.get_page_files(join(self.unzipped, "png")).values() + self.get_text_layer_files()
+
     def finalize(self):
         """ Finalize the job
         """
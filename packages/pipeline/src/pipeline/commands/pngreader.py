@@ -13,43 +13,469 @@
     National Institute of Standards and Technology
     http://www.nist.gov/itl/ssd/is
 """
-from os.path import join, isdir, split, dirname, basename, splitext, isfile
+import json
+from multiprocessing import cpu_count
+from os.path import join, isdir, splitext, isfile
 from subprocess import check_output, STDOUT
-from os import listdir
-from shutil import move
+from os import listdir, remove
+from shutil import move, copyfileobj, copyfile, rmtree
+from time import sleep, time
+from apputils.fileop import file_checksum
 from pipeline.command import Command
+from pipeline.commands.pdfconverter import get_page_ranges, rasterize_ghostscript, rasterize_pythonmagick
+from pipeline.locks import get_host_semaphore
+from pipeline.ocrserver import OcrClient
+from pipeline.pages import PageFilter, PageCache
+from pipeline.queue import parse_command_list
+
+
+def get_segment_order(segment_filename):
+    """Get the position of a line file in the document
+
+    Parameters:
+        segment_filename (str): Name of the line file (<page>-<line>.txt)
+
+    Returns:
+        tuple: Page number and line name
+    """
+    page, _, line = segment_filename.partition("-")
+    return int(page), line
+
+
+indicator_model = None
+"""IndicatorModel: Indicators of the denoiser shared by the jobs of the process, loaded when pages are read again
+"""
+
+
+def get_indicator_model(app_config):
+    """Get the indicators of the denoiser, loading them on first use
+
+    Parameters:
+        app_config (dict): Application configuration
+
+    Returns:
+        :class:`denoiser.models.IndicatorModel`: Indicators of the denoiser
+    """
+    global indicator_model
+
+    if indicator_model is None:
+        # The denoiser models import scikit-learn, which is only needed if pages are read again
+        from denoiser.models import IndicatorModel
+        indicator_model = IndicatorModel(app_config)
+
+    return indicator_model
+
+
+def get_garbage_ratio(filename, indicator_model):
+    """Compute the share of the lines of a text detected as garbage by the indicators of the denoiser
+
+    Parameters:
+        filename (str): Path of the text file
+        indicator_model (:class:`denoiser.models.IndicatorModel`): Indicators of the denoiser
+
+    Returns:
+        float: Share of garbage lines, 1 for a text without any line
+    """
+    from denoiser.text import Text  # Imports NLTK, only needed if pages are read again
+
+    text_data = Text(filename)
+
+    try:
+        text_data.read_txt()
+    except ZeroDivisionError:  # No line nor word to compute the statistics
+        return 1.
+
+    indicator_model.load(text_data)
+    indicator_model.correct(text_data)
+
+    lines = [line for paragraph in text_data.text for line in paragraph]
+    return len([line for line in lines if line.grade == 0]) / float(len(lines))
 
 
 class PNGReader(Command):
     """Command to convert PNG to TXT
     """
 
+    page_level = True
+
     def __init__(self, filename, logger, config):
         super(PNGReader, self).__init__(filename, logger, config)
 
-        self.proc_count = 1
+        self.proc_count = self.get_proc_count()
         self.ocropus_dir = self.config["command"]["ocropy"]["location"]
         self.rpred_model = self.config["command"]["ocropy"]["model"]
+        self.mode = self.config["command"]["ocropy"]["mode"]
+        self.adaptive = self.config["command"]["adaptive"]
         self.python = ["python"]
 
         self.logger.info("PNG reader initialized")
 
+    @classmethod
+    def preload(cls, app_config):
+        """Load the indicators of the denoiser if poor pages are read again
+
+        Parameters:
+            app_config (dict): Application configuration
+        """
+        if dict(parse_command_list(app_config))[cls.__name__].get("adaptive") is not None:
+            get_indicator_model(app_config)
+
     def execute(self):
         """Execute the command
         """
         self.logger.debug("::: PNG reading :::")
         # super(PNGReader, self).get_file()
 
-        procs = str(self.proc_count)
-
         png_dir = join(self.unzipped, "png")
         txt_dir = join(self.unzipped, "txt")
 
+        page_files = self.get_page_files(png_dir)
+        self.logger.debug(str(len(page_files)) + " page(s) to read")
+
+        # Every page may have been extracted from the text layer of the PDF
+        if len(page_files) == 0:
+            if self.pages is None:
+                if len(listdir(join(txt_dir, "segments"))) == 0:
+                    self.logger.error("No page to read in %s" % png_dir)
+                    self.finalize()
+                    return 1
+
+                self.assemble()
+
+            self.finalize()
+            return 0
+
+        # Blank pages and duplicates of other pages are not read
+        page_files, duplicates, page_hashes = self.filter_pages(page_files)
+
+        # Pages read before a failure of the job are not read again
+        checkpoint = self.get_checkpoint()
+
+        if checkpoint is not None:
+            page_files = {p: f for p, f in page_files.items() if not checkpoint.is_done(p)}
+            self.logger.debug("%d page(s) left to read" % len(page_files))
+
+        self.clear_pages(page_files)
+
+        if len(page_files) > 0:
+            # The cores of the machine are shared by the jobs running on it
+            cpus = get_host_semaphore(self.config["slave"]["locks"], "cpu", cpu_count())
+            proc_count = self.acquire_cpus(cpus)
+
+            if proc_count == 0:
+                self.logger.error("No free core to read %s" % self.filename)
+                self.finalize()
+                return 1
+
+            self.logger.debug("Reading %d page(s) with %d process(es)" % (len(page_files), proc_count))
+
+            pages = sorted(page_files.keys())
+            batch_size = self.config["commands"]["checkpoint"] if checkpoint is not None else len(pages)
+
+            try:
+                for index in xrange(0, len(pages), batch_size):
+                    batch_files = {p: page_files[p] for p in pages[index:index + batch_size]}
+                    status = self.read_pages(batch_files, proc_count)
+
+                    if status == 0 and self.adaptive is not None:
+                        status = self.reread_poor_pages(batch_files, proc_count)
+
+                    if status != 0:
+                        break
+
+                    if checkpoint is not None:
+                        checkpoint.add_pages({p: self.get_segment_files(p) for p in batch_files.keys()})
+            finally:
+                cpus.release_all()
+
+            if status != 0:
+                self.finalize()
+                return status
+
+        self.copy_duplicates(duplicates)
+        self.store_pages(page_hashes)
+
+        # A document processed by parts is only assembled once every part is done
+        if self.pages is None:
+            self.assemble()
+
+        if checkpoint is not None:
+            checkpoint.clear()
+
+        self.finalize()
+        return 0
+
+    def read_pages(self, page_files, proc_count):
+        """Read pages and gather their line files in txt/segments
+
+        Parameters:
+            page_files (dict): Path of the image of each page
+            proc_count (int): Number of processes used for the pages
+
+        Returns:
+            int: 0 when no errors happen, >0 otherwise
+        """
+        page_bases = [splitext(page_files[p])[0] for p in sorted(page_files.keys())]
+
+        if self.mode == "server":
+            status = self.read_server(page_bases, proc_count)
+        else:
+            status = self.read_subprocess(page_bases, proc_count)
+
+        if status != 0:
+            return status
+
+        # Gather the line files of every page
+        for page, page_base in zip(sorted(page_files.keys()), page_bases):
+            if not isdir(page_base):
+                continue
+
+            for f in listdir(page_base):
+                if f.endswith(".txt"):
+                    move(join(page_base, f), join(self.unzipped, "txt", "segments", str(page)+"-"+f))
+
+        return 0
+
+    def reread_poor_pages(self, page_files, proc_count):
+        """Convert again at a higher density, and read again, the pages whose text has too many garbage lines
+
+        Parameters:
+            page_files (dict): Path of the image of each page read
+            proc_count (int): Number of processes used for the pages
+
+        Returns:
+            int: 0 when no errors happen, >0 otherwise
+        """
+        segments_dir = join(self.unzipped, "txt", "segments")
+        indicator_model = get_indicator_model(self.config)
+        poor_pages = []
+
+        for page in sorted(page_files.keys()):
+            page_filename = join(segments_dir, "%d.page.tmp" % page)
+
+            try:
+                self.write_page_text(page, page_filename)
+                garbage_ratio = get_garbage_ratio(page_filename, indicator_model)
+            finally:
+                if isfile(page_filename):
+                    remove(page_filename)
+
+            if garbage_ratio > self.adaptive["max_garbage"]:
+                poor_pages.append(page)
+
+        self.logger.debug("%d page(s) to read again at %d dpi" % (len(poor_pages), self.adaptive["density"]))
+
+        if len(poor_pages) == 0:
+            return 0
+
+        self.clear_pages({page: page_files[page] for page in poor_pages})
+
+        try:
+            self.rasterize_pages(poor_pages)
+        except Exception, e:
+            self.logger.fatal("An exception has been caugth: "+str(e))
+            return 1
+
+        return self.read_pages({page: page_files[page] for page in poor_pages}, proc_count)
+
+    def clear_pages(self, page_files):
+        """Remove the results of a previous reading of pages
+
+        Parameters:
+            page_files (dict): Path of the image of each page
+        """
+        for page, page_file in page_files.items():
+            for f in self.get_segment_files(page):
+                remove(f)
+
+            page_base = splitext(page_file)[0]
+
+            if isdir(page_base):
+                rmtree(page_base)
+
+    def get_segment_files(self, page):
+        """List the line files of a page
+
+        Parameters:
+            page (int): Page number
+
+        Returns:
+            list: Paths of the line files
+        """
+        segments_dir = join(self.unzipped, "txt", "segments")
+        prefix = "%d-" % page
+
+        return [join(segments_dir, f) for f in listdir(segments_dir) if f.startswith(prefix) and f.endswith(".txt")]
+
+    def rasterize_pages(self, pages):
+        """Convert pages of the PDF file at the density of the second reading, replacing their images
+
+        Parameters:
+            pages (list): Sorted pages to convert
+        """
+        converter_config = dict(parse_command_list(self.config))["PDFConverter"]
+        base_filename = self.get_base_filename()
+
+        filename = join(self.unzipped, base_filename + ".pdf")
+        png_prefix = join(self.unzipped, "png", base_filename)
+        density = self.adaptive["density"]
+
+        if converter_config["rasterizer"]["backend"] == "ghostscript":
+            try:
+                for page_range in get_page_ranges(pages, len(pages)):
+                    rasterize_ghostscript(filename, page_range, png_prefix, density, converter_config["depth"],
+                                          converter_config["rasterizer"]["ghostscript"])
+
+                return
+            except OSError, e:  # Ghostscript is not installed
+                self.logger.warning("Cannot run Ghostscript (%s), falling back to PythonMagick" % str(e))
+
+        for page in pages:
+            rasterize_pythonmagick(filename, page, png_prefix, density, converter_config["depth"],
+                                   converter_config["quality"])
+
+    def write_page_text(self, page, filename):
+        """Write the text of a page, from its line files
+
+        Parameters:
+            page (int): Page number
+            filename (str): Path of the text file
+        """
+        segments_dir = join(self.unzipped, "txt", "segments")
+        segment_files = sorted([f for f in listdir(segments_dir) if f.endswith(".txt")], key=get_segment_order)
+
+        with open(filename, "wb") as page_file:
+            for f in segment_files:
+                if get_segment_order(f)[0] == page:
+                    with open(join(segments_dir, f), "rb") as txt:
+                        copyfileobj(txt, page_file)
+
+    def filter_pages(self, page_files):
+        """Find the pages which do not need to be read. Blank pages get an empty text, and pages already read in other
+        documents get their text from the page cache.
+
+        Parameters:
+            page_files (dict): Path of the image of each page
+
+        Returns:
+            tuple: Path of the image of each page to read, page duplicated by each duplicate page, and hash and share
+            of ink of each page to store in the page cache
+        """
+        filter_config = self.config["command"]["filter"]
+        page_filter = PageFilter(filter_config["blank"], filter_config["duplicates"], filter_config["ink_change"],
+                                 filter_config["hash_size"])
+        page_cache = self.get_page_cache() if filter_config["cache"] else None
+        segments_dir = join(self.unzipped, "txt", "segments")
+
+        pages_to_read = {}
+        duplicates = {}
+        page_hashes = {}
+        blank_pages = []
+        cached_pages = []
+
+        for page in sorted(page_files.keys()):
+            try:
+                page_type, page_data = page_filter.add_page(page, page_files[page])
+            except Exception, e:
+                self.logger.warning("Cannot filter page %d: %s" % (page, str(e)))
+                pages_to_read[page] = page_files[page]
+                continue
+
+            if page_type == "blank":
+                open(join(segments_dir, "%d-000000.txt" % page), "w").close()
+                blank_pages.append(page)
+            elif page_type == "duplicate":
+                duplicates[page] = page_data
+            elif page_cache is not None and page_cache.restore(page_data[0], page_data[1],
+                                                               join(segments_dir, "%d-000000.txt" % page)):
+                cached_pages.append(page)
+            else:
+                pages_to_read[page] = page_files[page]
+
+                if page_cache is not None:
+                    page_hashes[page] = page_data
+
+        self.logger.debug("%d blank page(s), %d duplicate(s), %d page(s) from the page cache"
+                          % (len(blank_pages), len(duplicates), len(cached_pages)))
+
+        return pages_to_read, duplicates, page_hashes
+
+    def copy_duplicates(self, duplicates):
+        """Give the duplicate pages the text of the pages they duplicate
+
+        Parameters:
+            duplicates (dict): Page duplicated by each duplicate page
+        """
+        segments_dir = join(self.unzipped, "txt", "segments")
+        segment_files = listdir(segments_dir)
+
+        for page, original_page in duplicates.items():
+            prefix = str(original_page) + "-"
+
+            for f in segment_files:
+                if f.startswith(prefix):
+                    copyfile(join(segments_dir, f), join(segments_dir, str(page) + "-" + f[len(prefix):]))
+
+    def store_pages(self, page_hashes):
+        """Store the text of the pages read in the page cache
+
+        Parameters:
+            page_hashes (dict): Hash and share of ink of each page to store
+        """
+        if len(page_hashes) == 0:
+            return
+
+        page_cache = self.get_page_cache()
+        segments_dir = join(self.unzipped, "txt", "segments")
+
+        for page, (page_hash, ink_ratio) in page_hashes.items():
+            page_filename = join(segments_dir, "%d.page.tmp" % page)
+
+            try:
+                self.write_page_text(page, page_filename)
+                page_cache.store(page_hash, ink_ratio, page_filename)
+            except Exception, e:
+                self.logger.warning("Cannot store page %d in the page cache: %s" % (page, str(e)))
+            finally:
+                if isfile(page_filename):
+                    remove(page_filename)
+
+        try:
+            removed = page_cache.prune()
+
+            if removed > 0:
+                self.logger.debug("%d file(s) removed from the page cache" % removed)
+        except Exception, e:
+            self.logger.warning("Cannot prune the page cache: %s" % str(e))
+
+    def get_page_cache(self):
+        """Get the page cache of the machine
+
+        Returns:
+            :class:`.PageCache`: Store of the text of the pages read
+        """
+        filter_config = self.config["command"]["filter"]
+
+        return PageCache(self.config["dirs"]["cache"], self.rpred_model, filter_config["ink_change"],
+                         filter_config["cache_size"] * 1024 * 1024)
+
+    def read_subprocess(self, page_bases, proc_count):
+        """Read pages with the Ocropy commands
+
+        Parameters:
+            page_bases (list): Paths of the page images, without extension
+            proc_count (int): Number of processes of each command
+
+        Returns:
+            int: 0 when no errors happen, >0 otherwise
+        """
+        procs = str(proc_count)
+
         command_list = [
-            [join(self.ocropus_dir, 'ocropus-nlbin'), "-Q", procs, join(png_dir, '*.png')],
-            [join(self.ocropus_dir, 'ocropus-gpageseg'), "-Q", procs, join(png_dir, '*.bin.png')],
-            [join(self.ocropus_dir, 'ocropus-rpred'), "-Q", procs, "-m", self.rpred_model,
-             join(png_dir, '*/*.bin.png')],
+            [join(self.ocropus_dir, 'ocropus-nlbin'), "-Q", procs] + [b + '.png' for b in page_bases],
+            [join(self.ocropus_dir, 'ocropus-gpageseg'), "-Q", procs] + [b + '.bin.png' for b in page_bases],
+            [join(self.ocropus_dir, 'ocropus-rpred'), "-Q", procs, "-m", self.rpred_model]
+            + [join(b, '*.bin.png') for b in page_bases],
         ]
 
         # Execute the list of command
@@ -62,43 +488,161 @@ class PNGReader(Command):
             except Exception, e:
                 print e
                 self.logger.fatal("An exception has been caugth: "+str(e.message))
-                self.finalize()
                 return 1
 
-        # Build the resulting text file from every line file
-        txt_files = [join(png_dir, subdir, f) for subdir in listdir(png_dir) if isdir(join(png_dir, subdir))
-                     for f in listdir(join(png_dir, subdir)) if f.endswith(".txt")]
-        self.logger.debug(str(len(txt_files)) + " text file(s) found")
+        return 0
 
-        for f in txt_files:
-            dirs = split(dirname(f))
+    def read_server(self, page_bases, proc_count):
+        """Read pages with the OCR server of the machine, or with the Ocropy commands if it cannot be reached
 
-            filename = basename(f)
-            pagenum = dirs[-1].split("-")[-1]
+        Parameters:
+            page_bases (list): Paths of the page images, without extension
+            proc_count (int): Number of processes used by the server
 
-            move(f, join(txt_dir, "segments", pagenum+"-"+filename))
+        Returns:
+            int: 0 when no errors happen, >0 otherwise
+        """
+        try:
+            client = OcrClient(self.config["command"]["ocropy"]["server"])
+        except Exception, e:
+            self.logger.warning("OCR server unavailable (%s), using the Ocropy commands" % str(e))
+            return self.read_subprocess(page_bases, proc_count)
 
-        txt_files = sorted([join(txt_dir, "segments", f) for f in listdir(join(txt_dir, "segments"))
-                            if f.endswith(".txt")])
+        try:
+            result = client.read(page_bases, proc_count)
+        except Exception, e:
+            self.logger.fatal("An exception has been caugth: "+str(e))
+            return 1
+        finally:
+            client.close()
 
-        text = ""
-        for f in txt_files:
-            with open(f, "r") as txt:
-                lines = txt.readlines()
+        if result["status"] == 0:
+            self.logger.info(result["output"])
+        else:
+            self.logger.fatal("The OCR server has failed: "+result["output"])
 
-                for l in lines:
-                    text += l
+        return result["status"]
 
-        pdf_files = [join(self.unzipped, f) for f in listdir(self.unzipped) if isfile(join(self.unzipped, f)) and
-                     f.endswith(".pdf")]
-        txt_filename = splitext(basename(pdf_files[0]))[0]+".txt"
+    def acquire_cpus(self, cpus):
+        """Take free cores of the machine, waiting for them at most the time set in the configuration
 
-        with open(join(txt_dir, txt_filename), "w") as output:
-            output.write(text)
+        Parameters:
+            cpus (:class:`.HostSemaphore`): Cores of the machine
+
+        Returns:
+            int: Number of cores taken, 0 if none has been freed in time
+        """
+        deadline = time() + self.config["command"]["ocropy"]["wait"]
+        proc_count = cpus.acquire_up_to(self.proc_count)
+
+        while proc_count == 0 and time() < deadline:
+            sleep(1)
+            proc_count = cpus.acquire_up_to(self.proc_count)
+
+        return proc_count
+
+    def get_proc_count(self):
+        """Get the number of processes of each Ocropy command
+
+        Unless set in the configuration, the cores of the machine are divided between the jobs of this step which can
+        run at the same time on it: the limit of the stage if any, or the number of slaves of the pool.
+
+        Returns:
+            int: Number of processes
+        """
+        if self.config["command"]["ocropy"]["procs"] > 0:
+            return self.config["command"]["ocropy"]["procs"]
+
+        stage_limits = self.config["slave"]["stages"] or {}
+        concurrent_jobs = stage_limits.get(self.__class__.__name__) or self.config["slave"].get("workers", 1)
+
+        return max(1, cpu_count() // concurrent_jobs)
+
+    def join(self):
+        """Assemble the text file once every page range has been read
+
+        Returns:
+            int: 0 when no errors happen, >0 otherwise
+        """
+        try:
+            self.assemble()
+        except Exception, e:
+            self.logger.fatal("An exception has been caugth: "+str(e.message))
+            return 1
 
-        self.finalize()
         return 0
 
+    def get_cache_inputs(self):
+        """List the images of the pages to read and the text of the pages with a text layer, assembled with them
+
+        Returns:
+            list: Paths of the input files
+        """
+        return self.get_page_files(join(self.unzipped, "png")).values() + self.get_text_layer_files()
+
+    def get_cache_params(self):
+        """Get the Ocropy model, the page filter and the settings of the second reading
+
+        Returns:
+            dict: Parameters of the command
+        """
+        return {
+            "model": self.rpred_model,
+            "model_checksum": file_checksum(self.rpred_model) if isfile(self.rpred_model) else None,
+            "filter": self.config["command"]["filter"],
+            "adaptive": self.adaptive
+        }
+
+    def get_cache_outputs(self):
+        """List the line files of the pages and the text file of the document, if it has been assembled
+
+        Returns:
+            list: Paths of the result files
+        """
+        segments_dir = join(self.unzipped, "txt", "segments")
+        pages = set(str(page) for page in self.get_page_files(join(self.unzipped, "png")).keys())
+
+        outputs = [join(segments_dir, f) for f in listdir(segments_dir)
+                   if f.endswith(".txt") and f.split("-", 1)[0] in pages]
+
+        if self.pages is None:
+            outputs.append(join(self.unzipped, "txt", self.get_base_filename() + ".txt"))
+            outputs.append(join(self.unzipped, "txt", self.get_base_filename() + ".pages.json"))
+
+        return outputs
+
+    def assemble(self):
+        """Build the resulting text file from every line file, in page order
+
+        The position of every page in the text file is written to <base>.pages.json, as a list of page number, offset
+        and length (in bytes).
+        """
+        txt_dir = join(self.unzipped, "txt")
+        segments_dir = join(txt_dir, "segments")
+
+        txt_files = sorted([f for f in listdir(segments_dir) if f.endswith(".txt")], key=get_segment_order)
+        self.logger.debug(str(len(txt_files)) + " text file(s) found")
+
+        page_offsets = []
+
+        with open(join(txt_dir, self.get_base_filename()+".txt"), "wb") as output:
+            for f in txt_files:
+                page = get_segment_order(f)[0]
+
+                if len(page_offsets) == 0 or page_offsets[-1]["page"] != page:
+                    page_offsets.append({"page": page, "offset": output.tell()})
+
+                with open(join(segments_dir, f), "rb") as txt:
+                    copyfileobj(txt, output)
+
+            page_ends = [p["offset"] for p in page_offsets[1:]] + [output.tell()]
+
+        for page_offset, page_end in zip(page_offsets, page_ends):
+            page_offset["length"] = page_end - page_offset["offset"]
+
+        with open(join(txt_dir, self.get_base_filename()+".pages.json"), "w") as pages_file:
+            json.dump({"pages": page_offsets}, pages_file)
+
     def finalize(self):
         """Finalize the job
         """
@@ -16,7 +16,7 @@
 import codecs
 from os.path import join, isfile, splitext, basename
 from os import listdir
-from denoiser import Denoiser
+from denoiser.cache import denoiser_cache, get_model_version
 from pipeline.command import Command
 
 
@@ -26,10 +26,17 @@ class TXTDenoiser(Command):
 
     def __init__(self, filename, logger, config):
         super(TXTDenoiser, self).__init__(filename, logger, config)
-        self.denoiser = Denoiser(config)
-
         self.logger.debug("Denoiser initialized")
 
+    @classmethod
+    def preload(cls, app_config):
+        """Load the denoiser models in the process cache
+
+        Parameters:
+            app_config (dict): Application configuration
+        """
+        denoiser_cache.get(app_config)
+
     def execute(self):
         """Execute the command
         """
@@ -45,7 +52,8 @@ class TXTDenoiser(Command):
                 self.finalize()
                 return -1
 
-            text_data = self.denoiser.cleanse(txt_files[0], False)
+            # The models are shared by every job of the process and updated by the cleansing
+            text_data = denoiser_cache.get(self.config).cleanse(txt_files[0], False)
 
             # Writing classified lines
             base_filename = splitext(basename(txt_files[0]))[0]
@@ -75,6 +83,37 @@ class TXTDenoiser(Command):
         self.finalize()
         return 0
 
+    def get_cache_inputs(self):
+        """List the text file of the document
+
+        Returns:
+            list: Paths of the input files
+        """
+        return [join(self.unzipped, "txt", self.get_base_filename() + ".txt")]
+
+    def get_cache_params(self):
+        """Get the version of the denoiser models
+
+        Cleansing a text updates the models on disk, so their checksums would change after every document. Their
+        version only changes when they are generated or imported.
+
+        Returns:
+            dict: Parameters of the command
+        """
+        return {"models": get_model_version(self.config)}
+
+    def get_cache_outputs(self):
+        """List the classified lines files
+
+        Returns:
+            list: Paths of the result files
+        """
+        txt_dir = join(self.unzipped, "txt")
+        base_filename = self.get_base_filename()
+
+        return [join(txt_dir, base_filename + ext) for ext in (".clean.txt", ".grbge.txt", ".unclss.txt")
+                if isfile(join(txt_dir, base_filename + ext))]
+
     def finalize(self):
         """Finalize the job
         """
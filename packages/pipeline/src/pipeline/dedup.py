@@ -0,0 +1,222 @@
+"""Package detecting documents which have already been submitted
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+from os import listdir, link
+from os.path import join, isfile
+from shutil import copyfile
+from pipeline.backends import get_backend
+from pipeline.utils import get_base_filename
+
+claim_script = """
+local done = redis.call('HGET', KEYS[1], ARGV[1])
+if done then
+    return {'done', done}
+end
+local owner = redis.call('HGET', KEYS[2], ARGV[1])
+if owner then
+    redis.call('LPUSH', ARGV[3] .. ARGV[1], ARGV[2])
+    return {'waiting', owner}
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[3], ARGV[2], ARGV[1])
+return {'new', ARGV[2]}
+"""
+"""str: Lua script registering a document and telling if it has already been processed or is being processed
+"""
+
+
+def claim_fallback(server, keys, args):
+    """Python version of `claim_script`, for the backends without Lua
+    """
+    done = server.hget(keys[0], args[0])
+
+    if done is not None:
+        return ["done", done]
+
+    owner = server.hget(keys[1], args[0])
+
+    if owner is not None:
+        server.lpush(args[2] + args[0], args[1])
+        return ["waiting", owner]
+
+    server.hset(keys[1], args[0], args[1])
+    server.hset(keys[2], args[1], args[0])
+    return ["new", args[1]]
+
+
+complete_script = """
+local file_hash = redis.call('HGET', KEYS[3], ARGV[1])
+if not file_hash then
+    return {}
+end
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[2], file_hash)
+redis.call('HSET', KEYS[1], file_hash, ARGV[2])
+local waiting = redis.call('LRANGE', ARGV[3] .. file_hash, 0, -1)
+redis.call('DEL', ARGV[3] .. file_hash)
+return waiting
+"""
+"""str: Lua script recording the output of a document and returning the duplicates waiting for it
+"""
+
+
+def complete_fallback(server, keys, args):
+    """Python version of `complete_script`, for the backends without Lua
+    """
+    file_hash = server.hget(keys[2], args[0])
+
+    if file_hash is None:
+        return []
+
+    server.hdel(keys[2], args[0])
+    server.hdel(keys[1], file_hash)
+    server.hset(keys[0], file_hash, args[1])
+
+    waiting = server.lrange(args[2] + file_hash, 0, -1)
+    server.delete(args[2] + file_hash)
+    return waiting
+
+
+abandon_script = """
+local file_hash = redis.call('HGET', KEYS[3], ARGV[1])
+if not file_hash then
+    return false
+end
+redis.call('HDEL', KEYS[3], ARGV[1])
+local next_owner = redis.call('RPOP', ARGV[2] .. file_hash)
+if next_owner then
+    redis.call('HSET', KEYS[2], file_hash, next_owner)
+    redis.call('HSET', KEYS[3], next_owner, file_hash)
+else
+    redis.call('HDEL', KEYS[2], file_hash)
+end
+return next_owner
+"""
+"""str: Lua script giving a failed document to its oldest waiting duplicate
+"""
+
+
+def abandon_fallback(server, keys, args):
+    """Python version of `abandon_script`, for the backends without Lua
+    """
+    file_hash = server.hget(keys[2], args[0])
+
+    if file_hash is None:
+        return None
+
+    server.hdel(keys[2], args[0])
+    next_owner = server.rpop(args[1] + file_hash)
+
+    if next_owner is not None:
+        server.hset(keys[1], file_hash, next_owner)
+        server.hset(keys[2], next_owner, file_hash)
+    else:
+        server.hdel(keys[1], file_hash)
+
+    return next_owner
+
+
+class DedupIndex(object):
+    """Redis index of the submitted documents, by content hash
+
+    A document is either done (its output directory is known), in flight (one data directory is being processed and
+    the duplicates submitted in the meantime wait for it) or unknown.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, name="dedup"):
+        self.server = get_backend(host, port, db)
+
+        self.done_name = name + ":done"  # Stores hash -> output directory
+        self.inflight_name = name + ":inflight"  # Stores hash -> data directory being processed
+        self.dirs_name = name + ":dirs"  # Stores data directory being processed -> hash
+        self.waiting_prefix = name + ":waiting:"  # Lists of the data directories waiting for a hash
+
+        self.claim_script = self.server.register_script(claim_script, claim_fallback)
+        self.complete_script = self.server.register_script(complete_script, complete_fallback)
+        self.abandon_script = self.server.register_script(abandon_script, abandon_fallback)
+
+    def claim(self, file_hash, dirname):
+        """Register a new data directory
+
+        Parameters
+            file_hash (str): Hash of the PDF file
+            dirname (str): Data directory of the PDF file
+
+        Returns
+            tuple: Status ('done', 'waiting' or 'new') and the directory holding (or that will hold) the results
+        """
+        status, location = self.claim_script(keys=[self.done_name, self.inflight_name, self.dirs_name],
+                                             args=[file_hash, dirname, self.waiting_prefix])
+        return status, location
+
+    def forget(self, file_hash):
+        """Remove a document from the processed ones, e.g. when its output directory has been removed
+
+        Parameters
+            file_hash (str): Hash of the PDF file
+        """
+        self.server.hdel(self.done_name, file_hash)
+
+    def complete(self, dirname, output_dir):
+        """Record the output directory of a processed data directory
+
+        Parameters
+            dirname (str): Data directory, as registered by :func:`claim`
+            output_dir (str): Location of the results
+
+        Returns
+            list: Data directories of the duplicates waiting for these results
+        """
+        return self.complete_script(keys=[self.done_name, self.inflight_name, self.dirs_name],
+                                    args=[dirname, output_dir, self.waiting_prefix])
+
+    def abandon(self, dirname):
+        """Release a data directory which cannot be processed
+
+        Parameters
+            dirname (str): Data directory, as registered by :func:`claim`
+
+        Returns
+            str: Data directory of the duplicate which has to be processed instead, None if there is none
+        """
+        return self.abandon_script(keys=[self.done_name, self.inflight_name, self.dirs_name],
+                                   args=[dirname, self.waiting_prefix])
+
+
+def link_outputs(source_dir, dest_dir):
+    """Give a data directory the text files of an identical document. Files are hard-linked when possible.
+
+    Parameters
+        source_dir (str): Directory of the processed document
+        dest_dir (str): Data directory of the duplicate
+    """
+    source_base = get_base_filename(source_dir)
+    dest_base = get_base_filename(dest_dir)
+
+    source_txt_dir = join(source_dir, "txt")
+    dest_txt_dir = join(dest_dir, "txt")
+
+    for filename in listdir(source_txt_dir):
+        source_file = join(source_txt_dir, filename)
+
+        if not isfile(source_file) or not filename.startswith(source_base + "."):
+            continue
+
+        dest_file = join(dest_txt_dir, dest_base + filename[len(source_base):])
+
+        try:
+            link(source_file, dest_file)
+        except OSError:  # Different filesystems
+            copyfile(source_file, dest_file)
@@ -0,0 +1,146 @@
+"""Package putting incoming files in the queue
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+from Queue import Queue, Empty
+from threading import Lock
+from pipeline.threads import StoppableThread
+
+
+class IngestionWorker(StoppableThread):
+    """Thread ingesting the files submitted to an `IngestionPool`
+    """
+
+    def __init__(self, pool):
+        StoppableThread.__init__(self)
+        self.daemon = True
+
+        self.pool = pool
+
+    def run(self):
+        while not self.is_stopped():
+            try:
+                filename = self.pool.files.get(timeout=1)
+            except Empty:
+                continue
+
+            try:
+                if self.pool.wait_for_room():
+                    self.pool.handle(filename)
+            finally:
+                self.pool.done(filename)
+
+
+class IngestionPool(object):
+    """Pool of threads ingesting incoming files in parallel
+
+    Ingestion is paused when the queue holds more than `high_water` jobs and resumed when it goes below `low_water`,
+    so that a large drop of files stays on disk instead of flooding the queue.
+    """
+
+    def __init__(self, callback, queue, logger, workers, high_water, low_water):
+        self.callback = callback
+        self.queue = queue
+        self.logger = logger
+
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+
+        self.files = Queue()
+        self.pending = set()  # Files submitted and not ingested yet
+        self.pending_lock = Lock()
+
+        self.paused = False
+        self.gate_lock = Lock()
+
+        self.workers = [IngestionWorker(self) for _ in xrange(max(workers, 1))]
+
+    def start(self):
+        """Start the ingestion threads
+        """
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, filename):
+        """Schedule the ingestion of a file. Files already waiting to be ingested are ignored.
+
+        Parameters
+            filename (str): Path of the incoming file
+        """
+        with self.pending_lock:
+            if filename in self.pending:
+                return
+
+            self.pending.add(filename)
+
+        self.files.put(filename)
+
+    def done(self, filename):
+        """Mark a file as ingested
+
+        Parameters
+            filename (str): Path of the incoming file
+        """
+        with self.pending_lock:
+            self.pending.discard(filename)
+
+    def handle(self, filename):
+        """Ingest a file, logging any error
+
+        Parameters
+            filename (str): Path of the incoming file
+        """
+        try:
+            self.callback(filename)
+        except Exception, e:
+            self.logger.error("Cannot ingest %s: %s" % (filename, str(e)))
+
+    def wait_for_room(self):
+        """Wait until the queue can receive new jobs. Every worker waits while one of them holds the gate.
+
+        Returns
+            bool: True if the file can be ingested, False if the pool has been stopped
+        """
+        with self.gate_lock:
+            while not self.is_stopped():
+                depth = len(self.queue)
+
+                if self.paused and depth < self.low_water:
+                    self.logger.info("%d jobs in the queue, resuming ingestion (%d files waiting)"
+                                     % (depth, self.files.qsize() + 1))
+                    self.paused = False
+                elif not self.paused and depth >= self.high_water:
+                    self.logger.info("%d jobs in the queue, pausing ingestion" % depth)
+                    self.paused = True
+
+                if not self.paused:
+                    return True
+
+                self.workers[0].stop_event.wait(1)
+
+            return False
+
+    def is_stopped(self):
+        """Test if the pool is stopped
+
+        Returns
+            bool: True if stopped, False otherwise
+        """
+        return self.workers[0].is_stopped()
+
+    def stop(self):
+        """Stop the ingestion threads. Files which are not ingested yet stay in the input directory.
+        """
+        for worker in self.workers:
+            worker.stop()
@@ -0,0 +1,135 @@
+"""Package defining locks shared by the processes of a machine
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import fcntl
+from os import makedirs, getpid, open as os_open, O_CREAT, O_RDWR
+from os.path import join, exists
+
+
+class HostSemaphore(object):
+    """Counting semaphore shared by every process of the machine
+
+    Each slot is a lock file. Slots are held with `flock`, so the kernel releases them if the holding process dies.
+    The lock files are opened once per process and their descriptors kept for the next acquisitions.
+    """
+
+    def __init__(self, lock_dir, name, count):
+        if not exists(lock_dir):
+            try:
+                makedirs(lock_dir)
+            except OSError:  # Created by another process in the meantime
+                pass
+
+        self.slots = [join(lock_dir, "%s.%d.lock" % (name, i)) for i in xrange(count)]
+        self.fds = {}  # Stores slot index -> file descriptor opened by this process
+        self.held = []  # Indices of the slots held by this process
+        self.pid = getpid()
+
+    def get_fd(self, index):
+        """Get the file descriptor of a slot, opening its lock file the first time
+
+        Parameters
+            index (int): Index of the slot
+
+        Returns
+            int: File descriptor of the lock file
+        """
+        # A forked child shares the open files of its parent, and so would share its locks
+        if self.pid != getpid():
+            self.fds = {}
+            self.held = []
+            self.pid = getpid()
+
+        if index not in self.fds:
+            self.fds[index] = os_open(self.slots[index], O_CREAT | O_RDWR)
+
+        return self.fds[index]
+
+    def acquire(self):
+        """Try to take a slot, without waiting
+
+        Returns
+            bool: True if a slot has been taken, False if they are all used
+        """
+        for index in xrange(len(self.slots)):
+            fd = self.get_fd(index)
+
+            if index in self.held:
+                continue
+
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                continue
+
+            self.held.append(index)
+            return True
+
+        return False
+
+    def acquire_up_to(self, count):
+        """Take as many slots as possible, up to `count`, without waiting
+
+        Parameters
+            count (int): Maximum number of slots to take
+
+        Returns
+            int: Number of slots taken
+        """
+        taken = 0
+
+        while taken < count and self.acquire():
+            taken += 1
+
+        return taken
+
+    def release_all(self):
+        """Release every slot taken by this process
+        """
+        while len(self.held) > 0:
+            self.release()
+
+    def release(self):
+        """Release the last slot taken by this process
+        """
+        if len(self.held) == 0:
+            return
+
+        index = self.held.pop()
+        fcntl.flock(self.get_fd(index), fcntl.LOCK_UN)
+
+
+host_semaphores = {}
+"""dict: Semaphores of the current process, by lock directory, name and count
+"""
+
+
+def get_host_semaphore(lock_dir, name, count):
+    """Get the semaphore of the current process for a shared resource, creating it the first time
+
+    Parameters
+        lock_dir (str): Directory of the lock files
+        name (str): Name of the resource
+        count (int): Number of slots
+
+    Returns
+        :class:`HostSemaphore`: Semaphore reused by every job of the process
+    """
+    key = (lock_dir, name, count)
+
+    if key not in host_semaphores:
+        host_semaphores[key] = HostSemaphore(lock_dir, name, count)
+
+    return host_semaphores[key]
@@ -15,22 +15,53 @@
 """
 import json
 import logging
-from time import sleep
+from threading import Lock
 from pipeline.threads import StoppableThread
 from pipeline.queue import QueueManager
 
 
+class LogFlusher(StoppableThread):
+    """Periodically send the buffered messages of an `AppLogger`
+    """
+
+    def __init__(self, app_logger, interval):
+        StoppableThread.__init__(self)
+        self.daemon = True
+
+        self.app_logger = app_logger
+        self.interval = interval
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.app_logger.flush()
+
+
 class AppLogger(object):
     """Logger publishing to a redis queue
+
+    Messages below `level` are not published. Published messages are buffered and sent by batches of `batch_size`, or
+    every `flush_interval` seconds.
     """
 
-    def __init__(self, uid, local_logger, queue_ip="127.0.0.1", queue_port=6379):
+    def __init__(self, uid, local_logger, queue_ip="127.0.0.1", queue_port=6379, level=logging.DEBUG, batch_size=1,
+                 flush_interval=1):
         self.log_queue = QueueManager(host=queue_ip, port=queue_port, qname="logging")
         self.logger = local_logger
 
         # Identify the logging process
         self.uid = uid
 
+        self.level = level
+        self.batch_size = batch_size
+        self.buffer = []
+        self.buffer_lock = Lock()
+
+        self.flusher = None
+
+        if batch_size > 1:
+            self.flusher = LogFlusher(self, flush_interval)
+            self.flusher.start()
+
     def log(self, level, message):
         """Log a message with a given level
 
@@ -38,14 +69,42 @@ class AppLogger(object):
             level (int): Log level
             message (str): Message to store
         """
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, "["+self.uid+"] "+message)
+
+        if level < self.level:
+            return
+
         log_mess = {
             "uid": self.uid,
             "lvl": level,
             "msg": message
         }
 
-        self.log_queue.push(json.dumps(log_mess))
-        self.logger.log(level, "["+self.uid+"] "+message)
+        with self.buffer_lock:
+            self.buffer.append(json.dumps(log_mess))
+            is_full = len(self.buffer) >= self.batch_size
+
+        if is_full:
+            self.flush()
+
+    def flush(self):
+        """Send the buffered messages
+        """
+        with self.buffer_lock:
+            messages = self.buffer
+            self.buffer = []
+
+        if len(messages) > 0:
+            self.log_queue.push_many(messages)
+
+    def close(self):
+        """Stop the periodic sending and send the remaining messages
+        """
+        if self.flusher is not None:
+            self.flusher.stop()
+
+        self.flush()
 
     def debug(self, message):
         """Log a debug message
@@ -92,28 +151,31 @@ class LogWriter(StoppableThread):
     """Pops element from the logging queue and write them in the proper directory
     """
 
-    def __init__(self, app_logger, queue_ip="127.0.0.1", queue_port=6379):
+    def __init__(self, app_logger, queue_ip="127.0.0.1", queue_port=6379, batch_size=1000):
         StoppableThread.__init__(self)
 
         self.log_queue = QueueManager(host=queue_ip, port=queue_port, qname="logging")
         self.logger = app_logger
+        self.batch_size = batch_size
 
     def write_logs(self):
         """Write logs to a local file
         """
-        while not self.log_queue.is_empty():
-            log_json = self.log_queue.pop()
-            log_data = json.loads(log_json)
+        while True:
+            log_list = self.log_queue.pop_many(self.batch_size)
+
+            for log_json in log_list:
+                log_data = json.loads(log_json)
+                self.logger.log(log_data["lvl"], "["+log_data["uid"]+"] "+log_data["msg"])
 
-            self.logger.log(log_data["lvl"], "["+log_data["uid"]+"] "+log_data["msg"])
-            sleep(0.2)
+            if len(log_list) < self.batch_size:  # The queue is empty
+                break
 
     def run(self):
         self.logger.debug("Logger initiatied")
 
-        while not self.stop_event.isSet():
+        while not self.stop_event.wait(0.5):
             self.write_logs()
-            sleep(0.5)
 
         self.write_logs()
         self.logger.info("Logger stopped")
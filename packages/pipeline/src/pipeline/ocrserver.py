@@ -0,0 +1,237 @@
+"""Package serving the OCR engine to the slaves of a machine
+
+Starting Ocropy for every document costs several seconds, mostly spent loading the recognition model. The server
+loads it once, before forking the processes recognizing the lines, and the slaves send it the pages they have to read.
+Binarization and segmentation have no model to load and still run as Ocropy commands.
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import logging
+import sys
+import traceback
+from glob import glob
+from multiprocessing import Pool, cpu_count
+from multiprocessing.connection import Listener, Client
+from os import remove
+from os.path import join, exists
+from subprocess import check_output, STDOUT
+from threading import Thread
+from pipeline.backends.local import get_address
+from pipeline.queue import parse_command_list
+
+recognizer = None
+"""Recognizer: Recognizer of the server, inherited by the processes of its pool
+"""
+
+
+class Recognizer(object):
+    """Ocropy line recognizer keeping its model in memory
+    """
+
+    def __init__(self, ocropus_dir, model):
+        # Ocropy is not installed as a package
+        if ocropus_dir not in sys.path:
+            sys.path.insert(0, ocropus_dir)
+
+        import ocrolib
+        from ocrolib import lstm
+
+        self.ocrolib = ocrolib
+        self.lstm = lstm
+
+        self.network = ocrolib.load_object(model, verbose=0)
+
+        for layer in self.network.walk():
+            layer.postLoad()
+
+        for layer in self.network.walk():
+            if isinstance(layer, lstm.LSTM):
+                layer.allocate(5000)
+
+        self.lnorm = getattr(self.network, "lnorm", None)
+
+        # Lines are normalized with the settings the network has been trained with
+        if self.lnorm is None:
+            raise ValueError("%s has no line normalizer" % model)
+
+    def recognize(self, filename, pad=16):
+        """Read a line image and write its text next to it, the way `ocropus-rpred` does
+
+        Parameters
+            filename (str): Path of the binarized line image (.bin.png)
+            pad (int): Padding added to the line
+        """
+        import numpy
+
+        line = self.ocrolib.read_image_gray(filename)
+
+        if numpy.prod(line.shape) == 0 or numpy.amax(line) == numpy.amin(line):
+            return
+
+        ink = numpy.amax(line) - line
+        self.lnorm.measure(ink * 1.0 / numpy.amax(ink))
+        line = self.lnorm.normalize(line, cval=numpy.amax(line))
+
+        text = self.network.predictString(self.lstm.prepare_line(line, pad))
+        text = self.ocrolib.normalize_text(text)
+        self.ocrolib.write_text(filename[:-len(".bin.png")] + ".txt", text)
+
+
+def recognize_lines(filenames):
+    """Recognize a list of lines with the recognizer of the process
+
+    Parameters
+        filenames (list): Paths of the line images
+
+    Returns
+        list: Error messages of the lines which could not be read
+    """
+    errors = []
+
+    for filename in filenames:
+        try:
+            recognizer.recognize(filename)
+        except Exception, e:
+            errors.append("%s: %s" % (filename, str(e)))
+
+    return errors
+
+
+class OcrServer(object):
+    """Server reading the pages sent by the slaves of the machine
+    """
+
+    def __init__(self, app_config):
+        global recognizer
+
+        self.logger = logging.getLogger("local")
+
+        ocropy_config = dict(parse_command_list(app_config))["PNGReader"]["ocropy"]
+        self.ocropus_dir = ocropy_config["location"]
+        self.address = get_address(ocropy_config["server"])
+        self.authkey = str(ocropy_config["server"]["authkey"])
+        self.python = ["python"]
+
+        self.logger.info("Loading %s..." % ocropy_config["model"])
+        recognizer = Recognizer(self.ocropus_dir, ocropy_config["model"])
+
+        # Forked after loading the model, so that it is shared copy-on-write
+        self.pool = Pool(cpu_count())
+        self.listener = None
+
+    def run(self):
+        """Accept the slaves until the server is stopped
+        """
+        # Socket left by a previous server
+        if isinstance(self.address, str) and exists(self.address):
+            remove(self.address)
+
+        self.listener = Listener(self.address, authkey=self.authkey)
+        self.logger.info("OCR server listening on %s" % str(self.address))
+
+        while True:
+            connection = self.listener.accept()
+
+            client = Thread(target=self.serve, args=(connection,))
+            client.daemon = True
+            client.start()
+
+    def serve(self, connection):
+        """Answer the requests of a slave until it disconnects
+
+        Parameters
+            connection (:class:`multiprocessing.connection.Connection`): Connection to the slave
+        """
+        try:
+            while True:
+                request = connection.recv()
+                connection.send(self.read(request["pages"], request["procs"]))
+        except EOFError:
+            pass
+        finally:
+            connection.close()
+
+    def read(self, page_bases, procs):
+        """Binarize, segment and recognize pages
+
+        Parameters
+            page_bases (list): Paths of the page images, without extension
+            procs (int): Number of processes used for the pages
+
+        Returns
+            dict: Status (0 when no errors happen, >0 otherwise) and output of the reading
+        """
+        command_list = [
+            [join(self.ocropus_dir, 'ocropus-nlbin'), "-Q", str(procs)] + [b + '.png' for b in page_bases],
+            [join(self.ocropus_dir, 'ocropus-gpageseg'), "-Q", str(procs)] + [b + '.bin.png' for b in page_bases],
+        ]
+
+        output = ""
+
+        try:
+            for command in command_list:
+                output += check_output(self.python+command, stderr=STDOUT)
+
+            lines = sorted([f for b in page_bases for f in glob(join(b, '*.bin.png'))])
+
+            # Each process of the pool recognizes one share of the lines
+            errors = self.pool.map(recognize_lines, [lines[i::procs] for i in xrange(procs)])
+        except Exception, e:
+            self.logger.error(traceback.format_exc())
+            return {"status": 1, "output": output + str(e)}
+
+        errors = [error for share in errors for error in share]
+
+        for error in errors:
+            self.logger.warning(error)
+
+        output += "%d line(s) recognized, %d error(s)" % (len(lines) - len(errors), len(errors))
+        return {"status": 0, "output": output}
+
+    def stop(self):
+        """Stop the server
+        """
+        if self.listener is not None:
+            self.listener.close()
+
+        self.pool.terminate()
+
+        if isinstance(self.address, str) and exists(self.address):
+            remove(self.address)
+
+
+class OcrClient(object):
+    """Client of the OCR server of the machine
+    """
+
+    def __init__(self, settings):
+        self.connection = Client(get_address(settings), authkey=str(settings["authkey"]))
+
+    def read(self, page_bases, procs):
+        """Have pages read by the server
+
+        Parameters
+            page_bases (list): Paths of the page images, without extension
+            procs (int): Number of processes used for the pages
+
+        Returns
+            dict: Status (0 when no errors happen, >0 otherwise) and output of the reading
+        """
+        self.connection.send({"pages": page_bases, "procs": procs})
+        return self.connection.recv()
+
+    def close(self):
+        """Disconnect from the server
+        """
+        self.connection.close()
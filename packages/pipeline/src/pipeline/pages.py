@@ -0,0 +1,237 @@
+"""Package finding the pages which do not need to be read: blank pages, and pages identical to a page already read
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import numpy
+from hashlib import sha256
+from os import getpid, rename
+from os.path import join, isfile
+from matplotlib.image import imread
+from pipeline.cache import atomic_copy, make_parent_dir, touch, prune
+
+
+def read_gray_image(filename):
+    """Read an image in gray levels
+
+    Parameters:
+        filename (str): Path of the PNG file
+
+    Returns:
+        numpy.ndarray: Gray level of every pixel, between 0 (black) and 1 (white)
+    """
+    image = imread(filename)
+
+    if image.ndim == 3:  # Color channels, and possibly an alpha channel
+        image = image[:, :, :3].mean(axis=2)
+
+    return image
+
+
+def get_ink_ratio(image, threshold=0.5, margin=0.05):
+    """Compute the share of dark pixels of a page, leaving out its margins where scans often have dark borders
+
+    Parameters:
+        image (numpy.ndarray): Gray levels of the page
+        threshold (float): Gray level under which a pixel is ink
+        margin (float): Share of the height and width of the page left out on each side
+
+    Returns:
+        float: Share of ink pixels, between 0 and 1
+    """
+    height, width = image.shape
+    top, left = int(height * margin), int(width * margin)
+    content = image[top:height - top, left:width - left]
+
+    if content.size == 0:
+        return 0.
+
+    histogram, _ = numpy.histogram(content, bins=256, range=(0., 1.))
+    return histogram[:int(256 * threshold)].sum() / float(content.size)
+
+
+def get_page_hash(image, hash_size=12, tolerance=0.01):
+    """Compute the difference hash of a page: similar pages have hashes differing by a few bits
+
+    Parameters:
+        image (numpy.ndarray): Gray levels of the page
+        hash_size (int): Size of the grid of the hash, which has hash_size * hash_size bits
+        tolerance (float): Difference of gray level under which two cells are equal, so that the noise of the empty
+            areas of the page does not change the hash
+
+    Returns:
+        str: Hexadecimal hash
+    """
+    height, width = image.shape
+
+    # Mean gray level of each cell of a (hash_size) x (hash_size + 1) grid
+    rows = numpy.linspace(0, height, hash_size + 1).astype(int)[:-1]
+    columns = numpy.linspace(0, width, hash_size + 2).astype(int)[:-1]
+    grid = numpy.add.reduceat(numpy.add.reduceat(image, rows, axis=0), columns, axis=1)
+    grid /= numpy.outer(numpy.diff(numpy.append(rows, height)), numpy.diff(numpy.append(columns, width)))
+
+    bits = (grid[:, 1:] > grid[:, :-1] + tolerance).flatten()
+    return "%0*x" % (hash_size * hash_size // 4, int("".join("1" if bit else "0" for bit in bits), 2))
+
+
+def get_hash_distance(page_hash1, page_hash2):
+    """Count the bits differing between two page hashes
+
+    Parameters:
+        page_hash1 (str): Hash of the first page
+        page_hash2 (str): Hash of the second page
+
+    Returns:
+        int: Number of different bits
+    """
+    return bin(int(page_hash1, 16) ^ int(page_hash2, 16)).count("1")
+
+
+def is_same_ink(ink_ratio1, ink_ratio2, max_change):
+    """Tell if two pages have the same share of ink, which the hash does not see
+
+    Parameters:
+        ink_ratio1 (float): Share of ink of the first page
+        ink_ratio2 (float): Share of ink of the second page
+        max_change (float): Maximum difference, relative to the page with the most ink
+
+    Returns:
+        bool: True if the shares of ink are close enough
+    """
+    return abs(ink_ratio1 - ink_ratio2) <= max_change * max(ink_ratio1, ink_ratio2)
+
+
+class PageCache(object):
+    """Local store of the text of the pages read, by page hash
+
+    Every text is stored with the share of ink of its page, checked before reusing it. The least recently used texts
+    are removed once the store exceeds its maximum size.
+    """
+
+    def __init__(self, cache_dir, model, max_ink_change, max_size=0):
+        self.pages_dir = join(cache_dir, "pages")
+        self.model = model  # The text of a page depends on the model which has read it
+        self.max_ink_change = max_ink_change
+        self.max_size = max_size  # In bytes, 0 for no limit
+
+    def get_page_path(self, page_hash):
+        """Get the location of the text of a page
+
+        Parameters:
+            page_hash (str): Hash of the page
+
+        Returns:
+            str: Path of the text file, the share of ink being stored next to it (.ink)
+        """
+        key = sha256(self.model + ":" + page_hash).hexdigest()
+        return join(self.pages_dir, key[:2], key + ".txt")
+
+    def restore(self, page_hash, ink_ratio, filename):
+        """Copy the stored text of a page
+
+        Parameters:
+            page_hash (str): Hash of the page
+            ink_ratio (float): Share of ink of the page
+            filename (str): Path of the text file to write
+
+        Returns:
+            bool: True if the text has been found, False otherwise
+        """
+        page_path = self.get_page_path(page_hash)
+        ink_path = page_path[:-len(".txt")] + ".ink"
+
+        if not isfile(page_path) or not isfile(ink_path):
+            return False
+
+        with open(ink_path, "r") as ink_file:
+            stored_ink_ratio = float(ink_file.read())
+
+        # Same hash, different page
+        if not is_same_ink(ink_ratio, stored_ink_ratio, self.max_ink_change):
+            return False
+
+        atomic_copy(page_path, filename)
+
+        touch(page_path)
+        touch(ink_path)
+        return True
+
+    def store(self, page_hash, ink_ratio, filename):
+        """Store the text of a page
+
+        Parameters:
+            page_hash (str): Hash of the page
+            ink_ratio (float): Share of ink of the page
+            filename (str): Path of the text file
+        """
+        page_path = self.get_page_path(page_hash)
+        ink_path = page_path[:-len(".txt")] + ".ink"
+
+        make_parent_dir(ink_path)
+        tmp_ink_path = "%s.%d.tmp" % (ink_path, getpid())
+
+        with open(tmp_ink_path, "w") as ink_file:
+            ink_file.write(repr(ink_ratio))
+
+        rename(tmp_ink_path, ink_path)
+        atomic_copy(filename, page_path)
+
+    def prune(self):
+        """Remove the least recently used texts if the store is too large
+
+        Returns:
+            int: Number of files removed
+        """
+        return prune([self.pages_dir], self.max_size)
+
+
+class PageFilter(object):
+    """Sort the pages of a document between the pages to read, blank pages and duplicates of another page
+    """
+
+    def __init__(self, max_ink, max_distance, max_ink_change, hash_size=12):
+        self.max_ink = max_ink  # Share of ink under which a page is blank
+        self.max_distance = max_distance  # Number of different bits under which two pages are identical
+        self.max_ink_change = max_ink_change  # Relative difference of ink under which two pages are identical
+        self.hash_size = hash_size
+
+        self.page_hashes = []  # Stores (page, hash, share of ink) of every page to read
+
+    def add_page(self, page, filename):
+        """Classify a page of the document
+
+        Parameters:
+            page (int): Page number
+            filename (str): Path of the image of the page
+
+        Returns:
+            tuple: "blank", "duplicate" (with the page it duplicates) or "read" (with the hash and the share of ink of
+            the page)
+        """
+        image = read_gray_image(filename)
+        ink_ratio = get_ink_ratio(image)
+
+        if self.max_ink > 0 and ink_ratio <= self.max_ink:
+            return "blank", None
+
+        page_hash = get_page_hash(image, self.hash_size)
+
+        # Pages with similar hashes and the same share of ink are identical
+        if self.max_distance >= 0:
+            for other_page, other_hash, other_ink_ratio in self.page_hashes:
+                if get_hash_distance(page_hash, other_hash) <= self.max_distance \
+                        and is_same_ink(ink_ratio, other_ink_ratio, self.max_ink_change):
+                    return "duplicate", other_page
+
+        self.page_hashes.append((page, page_hash, ink_ratio))
+        return "read", (page_hash, ink_ratio)
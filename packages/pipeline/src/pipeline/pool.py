@@ -0,0 +1,149 @@
+"""Package supervising a pool of slave processes
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import errno
+import logging
+import os
+import signal
+import traceback
+from multiprocessing import cpu_count
+from time import sleep, time
+from pipeline.actors import Slave
+from pipeline.commands import get_command
+from pipeline.queue import parse_command_list
+
+
+class SlavePool(object):
+    """Supervisor forking several slave processes on the local machine
+
+    Before forking, the supervisor imports the modules of the commands and loads their data (see
+    :meth:`.Command.preload`, e.g. the denoiser models), which the slaves then share copy-on-write.
+    """
+
+    def __init__(self, app_config, workers=0):
+        self.config = app_config
+        self.logger = logging.getLogger("local")
+
+        self.workers = workers if workers > 0 else cpu_count()
+
+        # Lets the commands share the resources of the machine between the slaves
+        self.config["slave"]["workers"] = self.workers
+        self.children = {}  # Stores pid -> (worker index, start time)
+        self.stopping = False
+
+        self.restart_delay = 1
+
+    def preload(self):
+        """Load the data shared by every slave, through the `preload` method of every command of the pipeline
+        """
+        for cmd_name, cmd_params in parse_command_list(self.config):
+            self.logger.debug("Preloading %s..." % cmd_name)
+            get_command(cmd_name).preload(self.config)
+
+        self.logger.info("Slave pool preloaded")
+
+    def spawn(self, index):
+        """Fork a new slave process
+
+        Parameters
+            index (int): Index of the worker in the pool
+        """
+        pid = os.fork()
+
+        if pid != 0:
+            self.children[pid] = (index, time())
+            self.logger.info("Slave #%d started (pid %d)" % (index, pid))
+            return
+
+        # Child process: leave the terminal process group so that only the supervisor receives Ctrl+C
+        os.setpgid(0, 0)
+        exit_code = 0
+
+        try:
+            slave = Slave(self.config)
+
+            def drain(signum, frame):
+                """Stop the slave once its current job is done
+
+                Parameters
+                    signum (int): Signal code
+                    frame (object): original signal
+                """
+                slave.stop()
+
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, drain)
+                signal.siginterrupt(signum, False)
+
+            slave.run()
+        except:
+            self.logger.error(traceback.format_exc())
+            exit_code = 1
+        finally:
+            logging.shutdown()
+            os._exit(exit_code)
+
+    def run(self):
+        """Start the slaves and restart them until the pool is stopped
+        """
+        self.preload()
+
+        for index in xrange(self.workers):
+            self.spawn(index)
+
+        while len(self.children) > 0:
+            try:
+                pid, status = os.wait()
+            except OSError, e:
+                if e.errno == errno.EINTR:  # Interrupted by a signal
+                    continue
+                raise
+
+            if pid not in self.children:
+                continue
+
+            index, start_time = self.children.pop(pid)
+
+            if self.stopping:
+                self.logger.info("Slave #%d stopped" % index)
+                continue
+
+            self.logger.warning("Slave #%d exited unexpectedly (status %d), restarting it" % (index, status))
+
+            # Avoid restarting in a loop a slave failing at startup
+            if time() - start_time < self.restart_delay:
+                sleep(self.restart_delay)
+
+            self.spawn(index)
+
+        self.logger.info("Slave pool stopped")
+
+    def stop(self):
+        """Ask the slaves to finish their current job and exit. Kill them if called a second time.
+        """
+        if self.stopping:
+            self.logger.warning("Killing %d slave(s)" % len(self.children))
+            signum = signal.SIGKILL
+        else:
+            self.logger.info("Draining %d slave(s)..." % len(self.children))
+            signum = signal.SIGTERM
+
+        self.stopping = True
+
+        for pid in self.children.keys():
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
@@ -14,8 +14,111 @@
     http://www.nist.gov/itl/ssd/is
 """
 import json
-import redis
-from pipeline.commands import *
+from os.path import join
+from collections import OrderedDict
+from time import time
+from pipeline.backends import get_backend
+from pipeline.commands import get_command
+from pipeline.threads import StoppableThread
+from pipeline.utils import split_pages, get_page_count, get_base_filename
+
+renew_script = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+"""str: Lua script updating a lease only if it is still held
+"""
+
+
+def renew_fallback(server, keys, args):
+    """Python version of `renew_script`, for the backends without Lua
+    """
+    if server.hget(keys[0], args[0]) is None:
+        return 0
+
+    server.hset(keys[0], args[0], args[1])
+    return 1
+
+
+join_script = """
+redis.call('HSET', KEYS[1], ARGV[1], 1)
+if redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 1
+end
+return 0
+"""
+"""str: Lua script registering a finished part and telling if every part is finished. The parts are kept until the
+merged job completes, so that the last part can be registered again if its slave dies.
+"""
+
+
+def join_fallback(server, keys, args):
+    """Python version of `join_script`, for the backends without Lua
+    """
+    server.hset(keys[0], args[0], 1)
+
+    if server.hlen(keys[0]) >= int(args[1]):
+        return 1
+
+    return 0
+
+
+leased_pop_script = """
+local item = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+if item then
+    redis.call('HSET', KEYS[3], KEYS[2], ARGV[1])
+    redis.call('HSET', KEYS[4], item, ARGV[2])
+end
+return item
+"""
+"""str: Lua script moving the oldest object of a queue to a processing queue and taking a lease on it
+"""
+
+
+def leased_pop_fallback(server, keys, args):
+    """Python version of `leased_pop_script`, for the backends without Lua
+    """
+    item = server.rpoplpush(keys[0], keys[1])
+
+    if item is not None:
+        server.hset(keys[2], keys[1], args[0])
+        server.hset(keys[3], item, args[1])
+
+    return item
+
+
+complete_script = """
+local held = redis.call('HDEL', KEYS[1], ARGV[1])
+if held == 1 then
+    redis.call('HDEL', KEYS[4], ARGV[1])
+    if ARGV[2] ~= '' then
+        redis.call('LPUSH', KEYS[3], ARGV[2])
+    end
+end
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+return held
+"""
+"""str: Lua script releasing the lease on an object, forgetting its expired deliveries and pushing its next state if
+the lease was still held, and removing it from its processing queue
+"""
+
+
+def complete_fallback(server, keys, args):
+    """Python version of `complete_script`, for the backends without Lua
+    """
+    held = server.hdel(keys[0], args[0])
+
+    if held == 1:
+        server.hdel(keys[3], args[0])
+
+        if args[1] != "":
+            server.lpush(keys[2], args[1])
+
+    server.lrem(keys[1], 1, args[0])
+    return held
 
 
 class QueueManager(object):
@@ -23,20 +126,41 @@ class QueueManager(object):
     """
 
     def __init__(self, host="127.0.0.1", port=6379, db=0, qname=None):
-        self.server = redis.StrictRedis(host, port, db)
+        self.server = get_backend(host, port, db)
 
         if qname is not None:
             self.queue_name = qname
         else:
             self.queue_name = "default"
 
+        # Leases of the jobs being processed and processing queues known by the queue
+        self.lease_name = self.queue_name + ":leases"
+        self.consumers_name = self.queue_name + ":consumers"
+        self.deliveries_name = self.queue_name + ":deliveries"  # Number of expired leases of each object
+        self.renew_script = self.server.register_script(renew_script, renew_fallback)
+        self.join_script = self.server.register_script(join_script, join_fallback)
+        self.leased_pop_script = self.server.register_script(leased_pop_script, leased_pop_fallback)
+        self.complete_script = self.server.register_script(complete_script, complete_fallback)
+
     def push(self, json_object):
         """Push JSON on a redis queue
 
+        Objects enter the queue from the head and leave it from the tail, which lets :func:`reliable_pop` use
+        BRPOPLPUSH while keeping the FIFO order.
+
         Parameters
             json_object (dict): JSON to push to redis
         """
-        self.server.rpush(self.queue_name, json_object)
+        self.server.lpush(self.queue_name, json_object)
+
+    def push_many(self, json_objects):
+        """Push several objects in a single round trip, keeping their order
+
+        Parameters
+            json_objects (list): JSON objects to push to redis
+        """
+        if len(json_objects) > 0:
+            self.server.lpush(self.queue_name, *json_objects)
 
     def pop(self):
         """Pop object from a redis queue
@@ -44,7 +168,270 @@ class QueueManager(object):
         Returns
             dict: JSON from redis
         """
-        return self.server.lpop(self.queue_name)
+        return self.server.rpop(self.queue_name)
+
+    def pop_many(self, count):
+        """Pop up to `count` objects in a single round trip
+
+        Parameters
+            count (int): Maximum number of objects to pop
+
+        Returns
+            list: JSON objects from redis, oldest first
+        """
+        pipe = self.server.pipeline()
+        pipe.lrange(self.queue_name, -count, -1)
+        pipe.ltrim(self.queue_name, 0, -count - 1)
+
+        json_objects = pipe.execute()[0]
+        json_objects.reverse()
+
+        return json_objects
+
+    def reliable_pop(self, processing_queue, timeout=None):
+        """Move the oldest object of the queue to a processing queue and return it
+
+        The object stays in the processing queue until :func:`ack` is called. If `timeout` is None the call returns
+        immediately, otherwise it blocks until an object is available or `timeout` seconds have passed (0 blocks
+        indefinitely).
+
+        Parameters
+            processing_queue (str): Name of the processing queue
+            timeout (int): Maximum number of seconds to wait for an object
+
+        Returns
+            dict: JSON from redis, None if the queue stayed empty
+        """
+        if timeout is None:
+            return self.server.rpoplpush(self.queue_name, processing_queue)
+
+        return self.server.brpoplpush(self.queue_name, processing_queue, timeout)
+
+    def leased_pop(self, processing_queue, duration, timeout=None):
+        """Move the oldest object of the queue to a processing queue and take a lease on it
+
+        Without `timeout`, this is done in a single round trip.
+
+        Parameters
+            processing_queue (str): Name of the processing queue
+            duration (int): Duration of the lease in seconds
+            timeout (int): Maximum number of seconds to wait for an object, None to return immediately
+
+        Returns
+            dict: JSON from redis, None if the queue stayed empty
+        """
+        if timeout is not None:
+            json_object = self.reliable_pop(processing_queue, timeout)
+
+            if json_object is not None:
+                self.lease(processing_queue, json_object, duration)
+
+            return json_object
+
+        lease_data = {
+            "owner": processing_queue,
+            "deadline": time() + duration
+        }
+
+        return self.leased_pop_script(keys=[self.queue_name, processing_queue, self.consumers_name, self.lease_name],
+                                      args=[time(), json.dumps(lease_data)])
+
+    def complete(self, processing_queue, json_object, next_queue=None, next_object=None):
+        """Release the lease on a processed object, push its next state to another queue and remove it from its
+        processing queue, in a single round trip. The next state is only pushed if the lease was still held.
+
+        Parameters
+            processing_queue (str): Name of the processing queue holding the object
+            json_object (dict): Leased JSON
+            next_queue (str): Name of the queue receiving the next state, None if there is nothing to push
+            next_object (dict): Next state of the object
+
+        Returns
+            bool: True if the lease was still held, False if the object has been put back in the queue
+        """
+        if next_queue is None:
+            next_queue, next_object = self.queue_name, ""
+
+        return self.complete_script(keys=[self.lease_name, processing_queue, next_queue, self.deliveries_name],
+                                    args=[json_object, next_object]) == 1
+
+    def ack(self, processing_queue, json_object):
+        """Remove a processed object from a processing queue
+
+        Parameters
+            processing_queue (str): Name of the processing queue
+            json_object (dict): JSON returned by :func:`reliable_pop`
+        """
+        self.server.lrem(processing_queue, 1, json_object)
+
+    def requeue(self, processing_queue):
+        """Put back in the queue every object of a processing queue, e.g. after a crash of its consumer
+
+        Parameters
+            processing_queue (str): Name of the processing queue
+
+        Returns
+            int: Number of objects put back in the queue
+        """
+        requeued = 0
+
+        while self.server.rpoplpush(processing_queue, self.queue_name) is not None:
+            requeued += 1
+
+        return requeued
+
+    def lease(self, processing_queue, json_object, duration):
+        """Take a lease on an object of a processing queue
+
+        An object whose lease is not renewed within `duration` seconds is put back in the queue by :func:`reap`.
+
+        Parameters
+            processing_queue (str): Name of the processing queue holding the object
+            json_object (dict): JSON returned by :func:`reliable_pop`
+            duration (int): Duration of the lease in seconds
+        """
+        lease_data = {
+            "owner": processing_queue,
+            "deadline": time() + duration
+        }
+
+        pipe = self.server.pipeline(transaction=False)
+        pipe.hset(self.consumers_name, processing_queue, time())
+        pipe.hset(self.lease_name, json_object, json.dumps(lease_data))
+        pipe.execute()
+
+    def take(self, processing_queue, json_object, duration):
+        """Put an object popped from the queue in a processing queue and take a lease on it
+
+        Parameters
+            processing_queue (str): Name of the processing queue
+            json_object (dict): JSON popped from the queue
+            duration (int): Duration of the lease in seconds
+        """
+        lease_data = {
+            "owner": processing_queue,
+            "deadline": time() + duration
+        }
+
+        pipe = self.server.pipeline(transaction=True)
+        pipe.lpush(processing_queue, json_object)
+        pipe.hset(self.consumers_name, processing_queue, time())
+        pipe.hset(self.lease_name, json_object, json.dumps(lease_data))
+        pipe.execute()
+
+    def renew(self, processing_queue, json_object, duration):
+        """Extend the lease on an object
+
+        Parameters
+            processing_queue (str): Name of the processing queue holding the object
+            json_object (dict): Leased JSON
+            duration (int): Duration of the lease in seconds
+
+        Returns
+            bool: True if the lease has been extended, False if it has been lost
+        """
+        lease_data = {
+            "owner": processing_queue,
+            "deadline": time() + duration
+        }
+
+        return self.renew_script(keys=[self.lease_name], args=[json_object, json.dumps(lease_data)]) == 1
+
+    def release(self, json_object):
+        """Release the lease on an object
+
+        Parameters
+            json_object (dict): Leased JSON
+
+        Returns
+            bool: True if the lease was still held, False if the object has been put back in the queue
+        """
+        return self.server.hdel(self.lease_name, json_object) == 1
+
+    def reap(self, grace, max_deliveries=0):
+        """Put back in the queue every object whose lease has expired
+
+        Objects found in a processing queue without any lease (the consumer died right after popping them) receive a
+        lease of `grace` seconds, so they are recovered as well if nobody claims them. An object whose lease expires
+        `max_deliveries` times (e.g. a job killing every slave processing it) is removed from the queue.
+
+        Parameters
+            grace (int): Duration of the lease given to unleased objects
+            max_deliveries (int): Number of expired leases after which an object is given up, 0 for no limit
+
+        Returns
+            tuple: Number of objects put back in the queue, list of the objects given up
+        """
+        now = time()
+        leases = self.server.hgetall(self.lease_name)
+
+        for processing_queue in self.server.hkeys(self.consumers_name):
+            items = self.server.lrange(processing_queue, 0, -1)
+
+            if len(items) == 0:
+                self.server.hdel(self.consumers_name, processing_queue)
+                continue
+
+            lease_data = json.dumps({
+                "owner": processing_queue,
+                "deadline": now + grace
+            })
+
+            for item in items:
+                if item not in leases:
+                    self.server.hsetnx(self.lease_name, item, lease_data)
+
+        requeued = 0
+        abandoned = []
+
+        for item, lease_json in leases.items():
+            lease_data = json.loads(lease_json)
+
+            if lease_data["deadline"] > now:
+                continue
+
+            # Deleting the lease decides who owns the object if the consumer releases it at the same time
+            if self.server.hdel(self.lease_name, item) == 0:
+                continue
+
+            self.server.lrem(lease_data["owner"], 1, item)
+
+            # The object comes back unchanged, so its expired leases are counted apart
+            deliveries = int(self.server.hget(self.deliveries_name, item) or 0) + 1
+
+            if 0 < max_deliveries <= deliveries:
+                self.server.hdel(self.deliveries_name, item)
+                abandoned.append(item)
+                continue
+
+            self.server.hset(self.deliveries_name, item, deliveries)
+            self.server.rpush(self.queue_name, item)  # Expired objects are the next ones to be popped
+            requeued += 1
+
+        return requeued, abandoned
+
+    def join(self, name, part, parts):
+        """Register a finished part of a job split in several parts
+
+        Registering the same part twice (e.g. after its lease expired) is harmless.
+
+        Parameters
+            name (str): Identifier of the job
+            part (str): Identifier of the part
+            parts (int): Total number of parts
+
+        Returns
+            bool: True if every part is finished, False otherwise
+        """
+        return self.join_script(keys=[self.queue_name + ":join:" + name], args=[part, parts]) == 1
+
+    def forget_join(self, name):
+        """Remove the finished parts of a job, once the merged job has completed
+
+        Parameters
+            name (str): Identifier of the job
+        """
+        self.server.delete(self.queue_name + ":join:" + name)
 
     def is_empty(self):
         """Test if the queue is empty or not
@@ -58,46 +445,347 @@ class QueueManager(object):
         return self.server.llen(self.queue_name)
 
 
+def leased_pop_any(queues, processing_queues, duration, timeout):
+    """Wait for an object on several queues, then move it to the processing queue of its queue and take a lease on it
+
+    The queues are waited on with a single blocking call, and are checked in order. An object popped by a consumer
+    dying before it is moved to its processing queue is lost.
+
+    Parameters
+        queues (list): Queues (:class:`QueueManager`) to wait on, sharing the same server
+        processing_queues (list): Name of the processing queue of each queue
+        duration (int): Duration of the lease in seconds
+        timeout (int): Maximum number of seconds to wait for an object, 0 to wait indefinitely
+
+    Returns
+        tuple: Queue and JSON of the object, None if the queues stayed empty
+    """
+    popped = queues[0].server.brpop([queue.queue_name for queue in queues], timeout)
+
+    if popped is None:
+        return None
+
+    queue_name, json_object = popped
+    index = [queue.queue_name for queue in queues].index(queue_name)
+
+    queues[index].take(processing_queues[index], json_object, duration)
+    return queues[index], json_object
+
+
+def parse_command_list(app_config):
+    """Read the list of commands from the configuration
+
+    Parameters
+        app_config (dict): Application configuration
+
+    Returns
+        list: Name and parameters (None if there is none) of every command
+
+    Raises
+        SyntaxError: The command list is not correctly formatted
+    """
+    command_list = []
+
+    for cmd in app_config["commands"]["list"]:
+        cmd_name = None
+        cmd_params = None
+
+        if type(cmd) == str:
+            cmd_name = cmd
+        elif type(cmd) == dict:
+            if len(cmd.keys()) == 1:
+                cmd_name = cmd.keys()[0]
+                cmd_params = cmd.values()[0]
+        if cmd_name is None:
+            raise SyntaxError(
+                "Command list is not correctly formatted"
+            )
+
+        command_list.append((cmd_name, cmd_params))
+
+    return command_list
+
+
+def get_stage_queues(app_config, host="127.0.0.1", port=6379):
+    """Build the queue of every step of the command list
+
+    Parameters
+        app_config (dict): Application configuration
+        host (str): Redis host
+        port (int): Redis port
+
+    Returns
+        OrderedDict: Queue of every command, in the order of the command list
+    """
+    stage_queues = OrderedDict()
+
+    for cmd_name, cmd_params in parse_command_list(app_config):
+        if cmd_name not in stage_queues:
+            stage_queues[cmd_name] = QueueManager(host=host, port=port, qname="commands:" + cmd_name)
+
+    return stage_queues
+
+
+def parse_affinity(app_config, command_list):
+    """Read which steps have to run back to back on the same slave
+
+    The affinity is either "all" (the whole command list runs on one slave) or a list of groups of command names.
+    Commands missing from the groups are pushed back in the queue once done.
+
+    Parameters
+        app_config (dict): Application configuration
+        command_list (list): Commands, as returned by :func:`parse_command_list`
+
+    Returns
+        list: Group of every step
+
+    Raises
+        SyntaxError: The affinity is not correctly formatted
+    """
+    affinity = app_config["commands"].get("affinity")
+    cmd_names = [cmd_name for cmd_name, cmd_params in command_list]
+
+    if affinity is None:
+        return range(len(cmd_names))
+
+    if affinity == "all":
+        return [0] * len(cmd_names)
+
+    if type(affinity) != list or any(type(group) != list for group in affinity):
+        raise SyntaxError("Command affinity is not correctly formatted")
+
+    groups = range(len(affinity), len(affinity) + len(cmd_names))
+
+    for group_index, group in enumerate(affinity):
+        for index, cmd_name in enumerate(cmd_names):
+            if cmd_name in group:
+                groups[index] = group_index
+
+    return groups
+
+
+class LeaseRenewer(StoppableThread):
+    """Keeps the lease of a job alive while it is processed
+    """
+
+    def __init__(self, queue, processing_queue, json_object, duration):
+        StoppableThread.__init__(self)
+        self.daemon = True
+
+        self.queue = queue
+        self.processing_queue = processing_queue
+        self.json_object = json_object
+        self.duration = duration
+
+    def run(self):
+        # Renew well before the deadline to be robust to slow round trips
+        while not self.stop_event.wait(self.duration / 3.0):
+            if not self.queue.renew(self.processing_queue, self.json_object, self.duration):
+                break
+
+
+class LeaseReaper(StoppableThread):
+    """Periodically put back in their queue the jobs whose lease has expired
+    """
+
+    def __init__(self, queues, logger, lease_duration, interval, max_deliveries=0, abandon=None):
+        StoppableThread.__init__(self)
+
+        self.queues = queues
+        self.logger = logger
+        self.lease_duration = lease_duration
+        self.interval = interval
+        self.max_deliveries = max_deliveries  # Expired leases after which a job is given up
+        self.abandon = abandon  # Called with the JSON of every job given up
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            for queue in self.queues:
+                requeued, abandoned = queue.reap(self.lease_duration, self.max_deliveries)
+
+                if requeued > 0:
+                    self.logger.warning("%d expired job(s) put back in %s" % (requeued, queue.queue_name))
+
+                for cmd_json in abandoned:
+                    self.logger.error("Lease of %s expired %d times, giving up the job" % (cmd_json,
+                                                                                         self.max_deliveries))
+
+                    if self.abandon is not None:
+                        self.abandon(cmd_json)
+
+
+class QueueConsumer(StoppableThread):
+    """Hand over the objects of a queue as soon as they are pushed
+
+    Objects are kept in a processing queue until they have been handled, so that they are not lost if the consumer
+    stops unexpectedly.
+    """
+
+    def __init__(self, queue, callback, logger, timeout):
+        StoppableThread.__init__(self)
+
+        self.queue = queue
+        self.callback = callback
+        self.logger = logger
+        self.timeout = timeout
+
+        self.processing_queue = queue.queue_name + ":processing:consumer"
+
+    def run(self):
+        requeued = self.queue.requeue(self.processing_queue)
+
+        if requeued > 0:
+            self.logger.warning("%d object(s) put back in %s" % (requeued, self.queue.queue_name))
+
+        while not self.is_stopped():
+            json_object = self.queue.reliable_pop(self.processing_queue, self.timeout)
+
+            if json_object is None:
+                continue
+
+            try:
+                self.callback(json_object)
+            except Exception, e:
+                self.logger.error("Cannot handle %s: %s" % (json_object, str(e)))
+
+            self.queue.ack(self.processing_queue, json_object)
+
+
 class CommandQueueItem(object):
     """ Command stored in the redis queue.
     """
 
-    def __init__(self, filename="", jsondata="", logger=None, config=None):
+    def __init__(self, filename="", jsondata="", logger=None, config=None, pages=None, parts=1):
         if filename != "":
             self.current_step = 0
             self.filename = filename
             self.tries = 0
+            self.pages = pages
+            self.parts = parts
         else:  # Rebuild command from JSON
             data = json.loads(jsondata)
             self.current_step = data["command"]
             self.filename = data["filename"]
             self.tries = data["tries"]
+            self.pages = data.get("pages")
+            self.parts = data.get("parts", 1)
 
         # self.filename = join(self.filename)
         self.logger = logger
         self.config = config
 
-        # Building the command list
-        self.steps = []
-        for cmd in self.config["commands"]["list"]:
-            cmd_class = None
-            cmd_config = self.config
-
-            if type(cmd) == str:
-                cmd_class = eval(cmd)
-            elif type(cmd) == dict:
-                if len(cmd.keys()) == 1:
-                    cmd_class = eval(cmd.keys()[0])
-                    cmd_config["command"] = cmd.values()[0]
-            if cmd_class is None:
-                self.logger.fatal("Unreadable command list")
-                raise SyntaxError(
-                    "Command list is not correctly formatted"
-                )
-
-            self.steps.append(
-                cmd_class(self.filename, self.logger, cmd_config)
-            )
+        # Steps are only built when they are about to run
+        try:
+            self.commands = parse_command_list(self.config)
+            self.groups = parse_affinity(self.config, self.commands)
+        except SyntaxError:
+            self.logger.fatal("Unreadable command list")
+            raise
+
+        self.steps = {}
+
+    def get_step_class(self, index):
+        """Get the class of a step, importing its module if needed
+
+        Parameters:
+            index (int): Index of the step
+
+        Returns:
+            type: Class of the step
+        """
+        return get_command(self.commands[index][0])
+
+    def get_step(self, index):
+        """Get a step, building it on first use
+
+        Parameters:
+            index (int): Index of the step
+
+        Returns:
+            :class:`.Command`: Step of the job
+        """
+        if index not in self.steps:
+            cmd_name, cmd_params = self.commands[index]
+
+            # Every step gets its own parameters without altering the application configuration
+            cmd_config = dict(self.config)
+
+            if cmd_params is not None:
+                cmd_config["command"] = cmd_params
+
+            self.steps[index] = self.get_step_class(index)(self.filename, self.logger, cmd_config)
+
+        step = self.steps[index]
+        step.pages = self.pages
+
+        return step
+
+    def split(self, page_count, pages_per_job):
+        """Split the job in page ranges processed independently by the page-level steps
+
+        Parameters:
+            page_count (int): Number of pages of the document
+            pages_per_job (int): Maximum number of pages per part
+
+        Returns:
+            list: Jobs to push in the queue
+        """
+        if pages_per_job <= 0 or page_count <= pages_per_job or not self.get_step_class(self.current_step).page_level:
+            return [self]
+
+        ranges = split_pages(page_count, pages_per_job)
+
+        return [CommandQueueItem(filename=self.filename, logger=self.logger, config=self.config, pages=pages,
+                                 parts=len(ranges)) for pages in ranges]
+
+    def get_stage(self):
+        """Get the name of the current step
+
+        Returns:
+            str: Name of the command of the current step, None if the job is finished
+        """
+        if self.current_step == -1:
+            return None
+
+        return self.commands[self.current_step][0]
+
+    def has_affinity(self, step):
+        """Tell if the current step has to run on the slave which ran a given step
+
+        Parameters:
+            step (int): Index of the step already run
+
+        Returns:
+            bool: True if the current step must run locally, False if the job can go back to the queue
+        """
+        if self.current_step == -1:
+            return False
+
+        return self.groups[step] == self.groups[self.current_step]
+
+    def needs_join(self):
+        """Tell if the part has gone through every page-level step and must be merged with the other parts
+
+        Returns:
+            bool: True if the parts must be merged before going further
+        """
+        if self.pages is None:
+            return False
+
+        return self.current_step == -1 or not self.get_step_class(self.current_step).page_level
+
+    def join(self):
+        """Merge the parts of the job, once all of them have reached the end of their page-level steps
+
+        Returns:
+            int: 0 when no errors happen, >0 otherwise
+        """
+        last_step = len(self.commands) - 1 if self.current_step == -1 else self.current_step - 1
+
+        self.pages = None
+        self.parts = 1
+
+        return self.get_step(last_step).join()
 
     def execute(self):
         """Execute the command
@@ -105,8 +793,8 @@ class CommandQueueItem(object):
         Returns:
             int: 0 when no errors happen, >0 otherwise
         """
-        command = self.steps[self.current_step]
-        cmd_result = command.execute()
+        command = self.get_step(self.current_step)
+        cmd_result = command.run()
 
         if cmd_result == 1:  # The process has failed
             self.tries += 1
@@ -116,7 +804,7 @@ class CommandQueueItem(object):
         self.current_step += 1
 
         # Stop flag
-        if self.current_step >= len(self.steps):
+        if self.current_step >= len(self.commands):
             self.current_step = -1
             self.tries = 0
 
@@ -129,7 +817,29 @@ class CommandQueueItem(object):
             "tries": self.tries
         }
 
+        if self.pages is not None:
+            repr_str["pages"] = self.pages
+            repr_str["parts"] = self.parts
+
         return json.dumps(repr_str)
 
 
+def create_jobs(dirname, logger, config):
+    """Create the jobs processing a data directory, one per part of the document
+
+    Parameters:
+        dirname (str): Data directory of the document
+        logger (:class:`.AppLogger`): Logger of the jobs
+        config (dict): Application configuration
+
+    Returns:
+        list: Jobs to push in the queue of their first step
+    """
+    cmd = CommandQueueItem(filename=dirname, logger=logger, config=config)
+    filename = get_base_filename(dirname) + ".pdf"
 
+    try:
+        return cmd.split(get_page_count(join(dirname, filename)), config["commands"]["split"])
+    except Exception, e:
+        logger.warning("Cannot split %s: %s" % (filename, str(e)))
+        return [cmd]
@@ -13,13 +13,14 @@
     National Institute of Standards and Technology
     http://www.nist.gov/itl/ssd/is
 """
-from hashlib import sha256
-from os import makedirs
-from os.path import join
+from os import makedirs, listdir, stat, rename, remove
+from os.path import join, isfile, isdir, splitext, basename, exists
 from random import choice
-from shutil import move
+from shutil import move, copy2, copytree, rmtree
 from string import ascii_lowercase, digits
 from time import strftime, gmtime
+import PyPDF2
+from apputils.fileop import file_checksum
 
 local_config = {
     "tmp_dir": "tmp",  # FIXME not used anymore
@@ -27,12 +28,14 @@ local_config = {
 }
 
 
-def create_data_directory(filename, tmp_dir):
+def create_data_directory(filename, tmp_dir, file_hash=None, copy=False):
     """Create the data directory for a PDF file
 
     Parameters:
         filename (:func:`str`):
         tmp_dir (str):
+        file_hash (str): Checksum of the file, if already computed
+        copy (bool): Whether to copy the file instead of moving it
 
     Returns:
         :func:`str`  - Location of the directory
@@ -40,8 +43,11 @@ def create_data_directory(filename, tmp_dir):
     if not filename.endswith(".pdf"):
         return None
 
+    if file_hash is None:
+        file_hash = file_checksum(filename)
+
     # Generate a unique directory name
-    file_hash = sha256(open(filename).read()).hexdigest()[0:12]
+    file_hash = file_hash[0:12]
     creation_time = strftime("%Y%m%d.%H%M%S", gmtime())
     rand_str = ''.join(choice(ascii_lowercase + digits) for _ in range(6))
 
@@ -49,10 +55,88 @@ def create_data_directory(filename, tmp_dir):
 
     # Creating main directory with the PDF inside
     makedirs(tmp_dir)
-    move(filename, tmp_dir)
+
+    if copy:
+        copy2(filename, tmp_dir)
+    else:
+        move(filename, tmp_dir)
 
     # Creating subdirectories
     for subdir in local_config["dirs"]:
         makedirs(join(tmp_dir, subdir))
 
     return tmp_dir
+
+
+def move_directory(source, destination_dir):
+    """Move a directory into another one, replacing any previous version. The directory is renamed when both are on
+    the same filesystem, and copied then removed otherwise.
+
+    Parameters:
+        source (:func:`str`): Directory to move
+        destination_dir (:func:`str`): Directory receiving it
+
+    Returns:
+        str - New location of the directory
+    """
+    destination = join(destination_dir, basename(source))
+
+    if isdir(destination):
+        rmtree(destination)
+    elif exists(destination):
+        remove(destination)
+
+    if stat(source).st_dev == stat(destination_dir).st_dev:
+        rename(source, destination)
+        return destination
+
+    # The copy is only visible once complete
+    tmp_destination = destination + ".tmp"
+
+    if exists(tmp_destination):
+        rmtree(tmp_destination)
+
+    copytree(source, tmp_destination)
+    rename(tmp_destination, destination)
+    rmtree(source)
+
+    return destination
+
+
+def get_base_filename(dirname):
+    """Get the name of the PDF file of a data directory, without its extension
+
+    Parameters:
+        dirname (:func:`str`): Data directory
+
+    Returns:
+        str - Base name of the document
+    """
+    pdf_files = [f for f in listdir(dirname) if isfile(join(dirname, f)) and f.endswith(".pdf")]
+    return splitext(pdf_files[0])[0]
+
+
+def get_page_count(filename):
+    """Count the pages of a PDF file
+
+    Parameters:
+        filename (:func:`str`): Path to the PDF file
+
+    Returns:
+        int - Number of pages
+    """
+    with open(filename, "rb") as pdf:
+        return PyPDF2.PdfFileReader(pdf).getNumPages()
+
+
+def split_pages(page_count, pages_per_job):
+    """Split the pages of a document into ranges
+
+    Parameters:
+        page_count (int): Number of pages of the document
+        pages_per_job (int): Maximum number of pages per range
+
+    Returns:
+        list - List of [first, last) ranges
+    """
+    return [[first, min(first + pages_per_job, page_count)] for first in xrange(0, page_count, pages_per_job)]
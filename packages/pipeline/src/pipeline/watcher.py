@@ -0,0 +1,150 @@
+"""Package watching the input directory
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+from os import listdir, stat
+from os.path import join, basename
+from time import time
+from pipeline.threads import StoppableThread
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+class InputWatcher(StoppableThread):
+    """Hands over every file of a directory as soon as it is fully written
+
+    Files are detected with inotify (when they are closed after being written or moved into the directory) if
+    *pyinotify* is installed. Otherwise, the directory is scanned periodically and a file is handed over once its size
+    and modification time are stable between two scans. Files already in the directory when the watch starts are
+    handed over the same way, since they may still be being written.
+    """
+
+    def __init__(self, directory, callback, logger, interval):
+        StoppableThread.__init__(self)
+
+        self.directory = directory
+        self.callback = callback
+        self.logger = logger
+        self.interval = interval
+
+    def run(self):
+        if pyinotify is not None:
+            self.watch()
+        else:
+            self.logger.warning("pyinotify is not installed, polling %s every %ds" % (self.directory,
+                                                                                     self.interval))
+            self.poll()
+
+    def handle(self, filename):
+        """Hand over a file, logging any error
+
+        Parameters
+            filename (str): Path of the file
+        """
+        try:
+            self.callback(filename)
+        except Exception, e:
+            self.logger.error("Cannot handle %s: %s" % (filename, str(e)))
+
+    def get_states(self, filenames):
+        """Get the size and modification time of files of the directory
+
+        Parameters
+            filenames (list): Names of the files
+
+        Returns
+            dict: Size and modification time of each file still in the directory
+        """
+        states = {}
+
+        for filename in filenames:
+            try:
+                file_stat = stat(join(self.directory, filename))
+            except OSError:  # Removed in the meantime
+                continue
+
+            states[filename] = (file_stat.st_size, file_stat.st_mtime)
+
+        return states
+
+    def watch(self):
+        """Wait for inotify events on the directory
+        """
+        watcher = self
+
+        class EventHandler(pyinotify.ProcessEvent):
+            """Hand over files written or moved into the directory
+            """
+
+            def process_IN_CLOSE_WRITE(self, event):
+                pending.pop(basename(event.pathname), None)
+                watcher.handle(event.pathname)
+
+            def process_IN_MOVED_TO(self, event):
+                pending.pop(basename(event.pathname), None)
+                watcher.handle(event.pathname)
+
+        watch_manager = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(watch_manager, EventHandler(), timeout=1000)
+        watch_manager.add_watch(self.directory, pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO)
+
+        # Files written before the watch started, handed over once they are stable
+        pending = self.get_states(listdir(self.directory))
+        last_scan = time()
+
+        self.logger.info("Watching %s" % self.directory)
+
+        while not self.is_stopped():
+            if notifier.check_events():
+                notifier.read_events()
+                notifier.process_events()
+
+            if len(pending) == 0 or time() - last_scan < self.interval:
+                continue
+
+            current = self.get_states(pending.keys())
+
+            for filename, file_state in current.items():
+                if pending.get(filename) == file_state:
+                    del current[filename]
+                    self.handle(join(self.directory, filename))
+
+            pending = current
+            last_scan = time()
+
+        notifier.stop()
+
+    def poll(self):
+        """Scan the directory periodically
+        """
+        previous = {}  # Stores filename -> (size, mtime) from the previous scan
+        handed_over = set()
+
+        while True:
+            current = self.get_states(listdir(self.directory))
+
+            for filename, file_state in current.items():
+                if filename not in handed_over and previous.get(filename) == file_state:
+                    handed_over.add(filename)
+                    self.handle(join(self.directory, filename))
+
+            # Files removed from the directory can be handed over again if they come back
+            handed_over &= set(current.keys())
+            previous = current
+
+            if self.stop_event.wait(self.interval):
+                break
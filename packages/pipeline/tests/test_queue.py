@@ -0,0 +1,236 @@
+"""Tests of the queues, leases, joins and deduplication index on every backend
+
+The redis tests use the database 15 of a server running on localhost, and are skipped if there is none.
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import unittest
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from uuid import uuid4
+from pipeline.backends import use_backend, get_backend, backends, backend_config
+from pipeline.dedup import DedupIndex
+from pipeline.queue import QueueManager, leased_pop_any
+
+REDIS_DB = 15
+"""int: Redis database emptied by the tests
+"""
+
+
+class BackendTests(object):
+    """Checks run on every backend. Each test uses its own queue names, so that the tests share the store.
+    """
+
+    backend = None
+
+    @classmethod
+    def get_settings(cls, tmp_dir):
+        """Get the settings of the backend
+
+        Parameters
+            tmp_dir (str): Directory removed after the tests
+
+        Returns
+            dict: Settings of the backend
+        """
+        return None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = mkdtemp()
+        backends.clear()  # Clients of the backends tested before
+
+        app_config = {"queue": {"backend": cls.backend, cls.backend: cls.get_settings(cls.tmp_dir)}}
+        cls.server = use_backend(app_config, serve=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.server is not None:
+            cls.server.shutdown()
+
+        backends.clear()
+        backend_config.update(name="redis", settings=None)
+        rmtree(cls.tmp_dir)
+
+    def setUp(self):
+        self.prefix = "test:%s:" % uuid4().hex
+
+    def get_queue(self, name="queue"):
+        return QueueManager(db=REDIS_DB, qname=self.prefix + name)
+
+    def test_push_pop_fifo(self):
+        queue = self.get_queue()
+
+        queue.push_many(["job1", "job2"])
+        queue.push("job3")
+        queue.push_many(["job4", "job5"])
+
+        self.assertEqual(len(queue), 5)
+        self.assertEqual(queue.pop(), "job1")
+        self.assertEqual(queue.pop_many(2), ["job2", "job3"])
+        self.assertEqual(queue.pop_many(10), ["job4", "job5"])
+        self.assertIsNone(queue.pop())
+        self.assertTrue(queue.is_empty())
+
+    def test_leased_pop_complete(self):
+        queue = self.get_queue()
+        processing_queue = self.prefix + "processing"
+        next_queue = self.prefix + "next"
+
+        queue.push_many(["job1", "job2"])
+
+        self.assertEqual(queue.leased_pop(processing_queue, 60), "job1")
+        self.assertEqual(queue.server.lrange(processing_queue, 0, -1), ["job1"])
+        self.assertTrue(queue.renew(processing_queue, "job1", 60))
+
+        self.assertTrue(queue.complete(processing_queue, "job1", next_queue, "job1-next"))
+        self.assertEqual(queue.server.lrange(next_queue, 0, -1), ["job1-next"])
+        self.assertEqual(queue.server.llen(processing_queue), 0)
+        self.assertFalse(queue.renew(processing_queue, "job1", 60))
+        self.assertEqual(queue.reap(60), (0, []))
+        self.assertEqual(len(queue), 1)
+
+    def test_leased_pop_reap(self):
+        queue = self.get_queue()
+        processing_queue = self.prefix + "processing"
+
+        queue.push("job1")
+        self.assertEqual(queue.leased_pop(processing_queue, -1), "job1")  # Lease already expired
+        queue.push("job2")
+
+        self.assertEqual(queue.reap(60), (1, []))
+        self.assertEqual(queue.server.llen(processing_queue), 0)
+
+        # The consumer lost its lease, and the redelivered job is popped first
+        self.assertFalse(queue.complete(processing_queue, "job1", self.prefix + "next", "job1-next"))
+        self.assertEqual(queue.server.llen(self.prefix + "next"), 0)
+        self.assertEqual(queue.pop_many(10), ["job1", "job2"])
+
+    def test_reap_unleased(self):
+        queue = self.get_queue()
+        processing_queue = self.prefix + "processing"
+
+        # The consumer died between popping the job and taking its lease
+        queue.push("job1")
+        queue.leased_pop(self.prefix + "other", 60)
+        queue.push("job2")
+        self.assertEqual(queue.reliable_pop(processing_queue), "job2")
+        queue.server.hset(queue.consumers_name, processing_queue, 0)
+
+        self.assertEqual(queue.reap(-1), (0, []))  # Given an expired grace lease
+        self.assertEqual(queue.reap(-1), (1, []))
+        self.assertEqual(queue.pop(), "job2")
+
+    def test_reap_max_deliveries(self):
+        queue = self.get_queue()
+        processing_queue = self.prefix + "processing"
+
+        queue.push("job1")
+
+        queue.leased_pop(processing_queue, -1)
+        self.assertEqual(queue.reap(60, 2), (1, []))
+
+        queue.leased_pop(processing_queue, -1)
+        self.assertEqual(queue.reap(60, 2), (0, ["job1"]))
+        self.assertTrue(queue.is_empty())
+        self.assertEqual(queue.server.llen(processing_queue), 0)
+
+    def test_leased_pop_any(self):
+        queues = [self.get_queue("stage1"), self.get_queue("stage2")]
+        processing_queues = [self.prefix + "processing1", self.prefix + "processing2"]
+
+        queues[1].push("job1")
+        queue, json_object = leased_pop_any(queues, processing_queues, 60, 1)
+
+        self.assertIs(queue, queues[1])
+        self.assertEqual(json_object, "job1")
+        self.assertEqual(queue.server.lrange(processing_queues[1], 0, -1), ["job1"])
+        self.assertTrue(queue.complete(processing_queues[1], "job1"))
+
+        # Stages are checked in order
+        queues[1].push("job2")
+        queues[0].push("job3")
+        self.assertIs(leased_pop_any(queues, processing_queues, 60, 1)[0], queues[0])
+
+        queues[1].pop()
+        self.assertIsNone(leased_pop_any(queues, processing_queues, 60, 1))
+
+    def test_join(self):
+        queue = self.get_queue()
+
+        self.assertFalse(queue.join("doc", "[0, 2]", 2))
+        self.assertFalse(queue.join("doc", "[0, 2]", 2))  # Part redelivered after a lost lease
+        self.assertTrue(queue.join("doc", "[2, 4]", 2))
+        self.assertTrue(queue.join("doc", "[2, 4]", 2))
+        self.assertFalse(queue.join("other", "[0, 2]", 2))
+
+        queue.forget_join("doc")
+        self.assertFalse(queue.join("doc", "[2, 4]", 2))
+
+    def test_dedup_claim_abandon(self):
+        index = DedupIndex(db=REDIS_DB, name=self.prefix + "dedup")
+
+        self.assertEqual(tuple(index.claim("hash", "dir1")), ("new", "dir1"))
+        self.assertEqual(tuple(index.claim("hash", "dir2")), ("waiting", "dir1"))
+        self.assertEqual(tuple(index.claim("hash", "dir3")), ("waiting", "dir1"))
+
+        # The oldest duplicate takes over a failed document
+        self.assertEqual(index.abandon("dir1"), "dir2")
+        self.assertIsNone(index.abandon("dir1"))
+        self.assertEqual(list(index.complete("dir2", "output")), ["dir3"])
+        self.assertEqual(list(index.complete("dir2", "output")), [])
+        self.assertEqual(tuple(index.claim("hash", "dir4")), ("done", "output"))
+
+        index.forget("hash")
+        self.assertEqual(tuple(index.claim("hash", "dir5")), ("new", "dir5"))
+        self.assertIsNone(index.abandon("dir5"))
+        self.assertEqual(tuple(index.claim("hash", "dir6")), ("new", "dir6"))
+
+
+class LocalBackendTests(BackendTests, unittest.TestCase):
+    backend = "local"
+
+    @classmethod
+    def get_settings(cls, tmp_dir):
+        return {"address": join(tmp_dir, "queues.sock"), "authkey": "test"}
+
+
+class SqliteBackendTests(BackendTests, unittest.TestCase):
+    backend = "sqlite"
+
+    @classmethod
+    def get_settings(cls, tmp_dir):
+        return {"path": join(tmp_dir, "queues.db")}
+
+
+class RedisBackendTests(BackendTests, unittest.TestCase):
+    backend = "redis"
+
+    @classmethod
+    def setUpClass(cls):
+        super(RedisBackendTests, cls).setUpClass()
+
+        try:
+            get_backend(db=REDIS_DB).ping()
+        except Exception, e:
+            cls.tearDownClass()
+            raise unittest.SkipTest("No redis server: %s" % e)
+
+    def tearDown(self):
+        get_backend(db=REDIS_DB).flushdb()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,6 +20,9 @@ import os
 from apputils.config import load_config
 from apputils.fileop import create_directories
 from denoiser import Denoiser
+from denoiser.cache import update_model_version
+from pipeline.backends import use_backend
+from pipeline.queue import QueueManager, get_stage_queues
 from os.path import join, isdir, exists, abspath
 from fabric.contrib.console import confirm
 from fabric.contrib.project import upload_project
@@ -153,6 +156,33 @@ def create_models(dataset_dir):
     denoiser.train(dataset)
     logger.info("Classifier trained")
 
+    # Slaves reload the models and the cleaning results stored in the cache are left aside
+    update_model_version(app_config)
+
+
+@task
+def process(input_dir, output_dir, *options):
+    """Process a directory of PDF files on the local machine (without master nor slaves)
+
+    Parameters:
+        input_dir (:func:`str`): Directory containing the PDF files
+        output_dir (:func:`str`): Directory receiving the results
+        options (list): `--jobs N` to process N files at the same time (default to one per core)
+    """
+    import argparse
+    from pipeline.batch import process_directory
+
+    parser = argparse.ArgumentParser(prog="ui.py process input_dir output_dir")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="number of files processed at the same time")
+    opts = parser.parse_args(options)
+
+    if not isdir(input_dir):
+        logger.error(input_dir+" is not a valid directory")
+        exit(2)
+
+    if process_directory(app_config, input_dir, output_dir, opts.jobs) > 0:
+        exit(1)
+
 
 @task
 def check():
@@ -165,6 +195,21 @@ def check():
         launch_script(script)
 
 
+@task
+def status():
+    """Print the number of jobs waiting in every queue
+    """
+    redis_ip = app_config["redis"]["host"]
+    redis_port = app_config["redis"]["port"]
+
+    use_backend(app_config)
+    queues = get_stage_queues(app_config, redis_ip, redis_port)
+    queues["finished"] = QueueManager(host=redis_ip, port=redis_port, qname="finished")
+
+    for stage, queue in queues.items():
+        print stage+" "*(20-len(stage))+str(len(queue))
+
+
 # @task
 # @runs_once
 # def start_pipeline():
@@ -0,0 +1,137 @@
+"""This script measures the throughput of the queue backends on the local machine. The Redis server of the configuration
+is only used if it is reachable.
+
+For more information on how this script works, you can use the following command::
+
+    $ python2 bench_queue.py --help
+
+.. Authors:
+    Philippe Dessauw
+    philippe.dessauw@nist.gov
+
+.. Sponsor:
+    Alden Dima
+    alden.dima@nist.gov
+    Information Systems Group
+    Software and Systems Division
+    Information Technology Laboratory
+    National Institute of Standards and Technology
+    http://www.nist.gov/itl/ssd/is
+"""
+import json
+from multiprocessing import Process
+from os import getpid
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+
+def consume(queue_name, next_queue_name, processing_queue, host, port):
+    """Move every job of a queue to another one, the way slaves do
+
+    Parameters
+        queue_name (str): Queue to empty
+        next_queue_name (str): Queue receiving the jobs
+        processing_queue (str): Processing queue of the consumer
+        host (str): Redis host
+        port (int): Redis port
+    """
+    from pipeline.queue import QueueManager
+
+    queue = QueueManager(host=host, port=port, qname=queue_name)
+
+    while True:
+        job = queue.leased_pop(processing_queue, 600)
+
+        if job is None:
+            break
+
+        queue.complete(processing_queue, job, next_queue_name, job)
+
+
+def run_benchmark(app_config, job_count, consumer_count):
+    """Push jobs to a queue and move them to another one with several processes
+
+    Parameters
+        app_config (dict): Configuration of the backend
+        job_count (int): Number of jobs
+        consumer_count (int): Number of consumer processes
+
+    Returns
+        tuple: Jobs pushed per second, jobs moved per second
+    """
+    from pipeline.backends import use_backend
+    from pipeline.queue import QueueManager
+
+    host = app_config["redis"]["host"]
+    port = app_config["redis"]["port"]
+
+    queue_server = use_backend(app_config, serve=True)
+    queue = QueueManager(host=host, port=port, qname="bench:%d:in" % getpid())
+    next_queue = QueueManager(host=host, port=port, qname="bench:%d:out" % getpid())
+
+    jobs = [json.dumps({"command": 0, "filename": "/tmp/job.%d" % i, "tries": 0}) for i in xrange(job_count)]
+
+    start = time()
+    for job in jobs:
+        queue.push(job)
+    push_time = time() - start
+
+    consumers = [Process(target=consume, args=(queue.queue_name, next_queue.queue_name,
+                                               "%s:processing:%d" % (queue.queue_name, i), host, port))
+                 for i in xrange(consumer_count)]
+
+    start = time()
+    for consumer in consumers:
+        consumer.start()
+
+    for consumer in consumers:
+        consumer.join()
+    move_time = time() - start
+
+    if len(next_queue) != job_count:
+        print "Warning: %d jobs out of %d have been moved" % (len(next_queue), job_count)
+
+    queue.server.delete(next_queue.queue_name, queue.lease_name, queue.consumers_name)
+
+    if queue_server is not None:
+        queue_server.shutdown()
+
+    return job_count / push_time, job_count / move_time
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--backends", default="local,sqlite,redis",
+                        help="comma-separated backends to measure (default to local,sqlite,redis)")
+    parser.add_argument("-j", "--jobs", type=int, default=10000, help="number of jobs (default to 10000)")
+    parser.add_argument("-c", "--consumers", type=int, default=4, help="number of consumer processes (default to 4)")
+    parser.add_argument("--host", default="127.0.0.1", help="Redis host")
+    parser.add_argument("--port", type=int, default=6379, help="Redis port")
+    args = parser.parse_args()
+
+    tmp_dir = mkdtemp()
+
+    try:
+        for backend in args.backends.split(","):
+            bench_config = {
+                "redis": {"host": args.host, "port": args.port},
+                "queue": {
+                    "backend": backend,
+                    "local": {"address": join(tmp_dir, "queues"), "authkey": "bench"},
+                    "sqlite": {"path": join(tmp_dir, "queues.sqlite")},
+                }
+            }
+
+            try:
+                push_rate, move_rate = run_benchmark(bench_config, args.jobs, args.consumers)
+            except Exception, e:
+                print "%-8s unavailable (%s)" % (backend, str(e))
+                continue
+
+            print "%-8s %8d pushes/s %8d moves/s" % (backend, push_rate, move_rate)
+    finally:
+        rmtree(tmp_dir)
@@ -20,7 +20,7 @@ For more information on how this script works, you can use the following command
 import os
 
 if __name__ == "__main__":
-    from pipeline import run_master, run_slave
+    from pipeline import run_master, run_slave, run_slave_pool, run_ocr_server
     import argparse
 
     from apputils.config import load_config
@@ -31,15 +31,35 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-s", "--slave", action="store_true", help="launch a slave process")
     parser.add_argument("-m", "--master", action="store_true", help="launch a master process")
+    parser.add_argument("-o", "--ocr-server", action="store_true",
+                        help="launch the OCR server of the machine, used by PNGReader in server mode")
+    parser.add_argument("-w", "--workers", type=int, nargs="?", const=0, default=None,
+                        help="launch a pool of WORKERS slave processes (default to one per core)")
+    parser.add_argument("-t", "--stages",
+                        help="comma-separated stages handled by the slave, with an optional limit of concurrent jobs"
+                             " on the machine (e.g. PNGReader:4,TXTDenoiser)")
     args = parser.parse_args()
 
-    if args.master == args.slave:
+    if args.stages is not None:
+        app_config["slave"]["stages"] = {}
+
+        for stage in args.stages.split(","):
+            stage_name, _, stage_limit = stage.partition(":")
+            app_config["slave"]["stages"][stage_name] = int(stage_limit) if stage_limit else 0
+
+    if args.ocr_server:
+        print "Starting OCR server..."
+        run_ocr_server(app_config)
+    elif args.master == args.slave:
         print "Please choose what kind of process to launch"
         parser.print_help()
         exit()
     elif args.master:
         print "Starting master..."
         run_master(app_config)
+    elif args.slave and args.workers is not None:
+        print "Starting slave pool..."
+        run_slave_pool(app_config, args.workers)
     elif args.slave:
         print "Starting slave..."
         run_slave(app_config)